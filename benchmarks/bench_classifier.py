@@ -0,0 +1,134 @@
+"""
+Modality classifier evaluation for MedInsight AI - RadiologyAI Pro
+
+Runs modality_classifier over a labelled local corpus laid out as one folder
+per modality (xray/, ct/, mri/, ultrasound/), and reports accuracy, how many
+Gemini calls the confidence threshold avoids, and the accuracy of the
+predictions answered locally. With --gemini, every image is also classified
+by Gemini and the agreement rate between the two is reported. --synthetic
+writes a small generated corpus first, which only smoke-tests the pipeline.
+
+Run from the repository root:
+    python -m benchmarks.bench_classifier --corpus path/to/corpus [--gemini]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from modality_classifier import (CLASSIFIER_MIN_CONFIDENCE, MODALITY_LABELS, answers_locally,
+                                 classify_modality, parse_modality_label)
+from utils import process_image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.dcm', '.dicom')
+GEMINI_PROMPT = "Classify this medical image as X-ray, CT Scan, MRI Scan or Ultrasound. Answer with the type first."
+
+
+def synthetic_corpus(directory, per_class=5, seed=0):
+    """Write crude generated examples of each modality; only useful as a smoke test"""
+    from benchmarks.bench_upload import synthetic_film
+
+    rng = np.random.default_rng(seed)
+    size = 512
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    for label in MODALITY_LABELS:
+        os.makedirs(os.path.join(directory, label), exist_ok=True)
+        for index in range(per_class):
+            radius = size * rng.uniform(0.35, 0.45)
+            disc = (x - size / 2) ** 2 + (y - size / 2) ** 2 <= radius ** 2
+            if label == 'xray':
+                image = synthetic_film(int(size * rng.uniform(0.75, 0.9)), size, rgb=False, seed=index)
+            elif label == 'ct':
+                pixels = np.where(disc, 110 + rng.normal(0, 3, disc.shape), 0)
+                ring = disc & ((x - size / 2) ** 2 + (y - size / 2) ** 2 >= (radius - 10) ** 2)
+                pixels[ring] = 250
+                image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'L')
+            elif label == 'mri':
+                tissue = 60 + 120 * np.exp(-((x - size / 2) ** 2 + (y - size / 2) ** 2) / (2 * (radius / 1.5) ** 2))
+                pixels = np.where(disc, tissue + rng.normal(0, 12, disc.shape), np.abs(rng.normal(0, 8, disc.shape)))
+                image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'L')
+            else:
+                angle = np.arctan2(x - size / 2, y + 20)
+                depth = np.hypot(x - size / 2, y + 20)
+                fan = (np.abs(angle) < np.radians(rng.uniform(30, 40))) & (depth < size * 0.95)
+                speckle = rng.rayleigh(40, fan.shape)
+                pixels = np.where(fan, speckle + 30, 0)
+                image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'L')
+            image.save(os.path.join(directory, label, f"{label}_{index}.png"))
+
+
+def iter_corpus(directory):
+    for label in MODALITY_LABELS:
+        folder = os.path.join(directory, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield label, os.path.join(folder, name)
+
+
+def gemini_label(image):
+    from utils import generate_report_with_retry
+    return parse_modality_label(generate_report_with_retry(image, GEMINI_PROMPT, modality='classification'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='folder with one sub-folder of images per modality')
+    parser.add_argument('--synthetic', action='store_true', help='generate a small synthetic corpus instead')
+    parser.add_argument('--threshold', type=float, default=CLASSIFIER_MIN_CONFIDENCE, help='local confidence threshold')
+    parser.add_argument('--gemini', action='store_true', help='also classify every image with Gemini')
+    args = parser.parse_args()
+    if not args.corpus and not args.synthetic:
+        parser.error('give --corpus or --synthetic')
+
+    corpus = args.corpus
+    if args.synthetic:
+        corpus = tempfile.mkdtemp(prefix='modality_corpus_')
+        synthetic_corpus(corpus)
+
+    rows = []
+    for truth, path in iter_corpus(corpus):
+        with open(path, 'rb') as handle:
+            image = process_image(handle)
+        if image is None:
+            continue
+        started = time.perf_counter()
+        prediction = classify_modality(image)
+        row = {'path': os.path.relpath(path, corpus), 'truth': truth, 'local': prediction.label,
+               'confidence': round(prediction.confidence, 3), 'source': prediction.source,
+               'answered_locally': answers_locally(prediction, args.threshold),
+               'local_ms': round((time.perf_counter() - started) * 1000, 2)}
+        if args.gemini:
+            row['gemini'] = gemini_label(image)
+        rows.append(row)
+
+    confident = [r for r in rows if r['answered_locally']]
+    summary = {
+        'images': len(rows),
+        'threshold': args.threshold,
+        'accuracy': np.mean([r['local'] == r['truth'] for r in rows]).round(3).item() if rows else None,
+        'calls_avoided': len(confident),
+        'calls_avoided_rate': round(len(confident) / len(rows), 3) if rows else None,
+        'accuracy_when_local': (np.mean([r['local'] == r['truth'] for r in confident]).round(3).item()
+                                if confident else None),
+        'mean_local_ms': round(float(np.mean([r['local_ms'] for r in rows])), 2) if rows else None,
+    }
+    if args.gemini:
+        compared = [r for r in rows if r['gemini']]
+        summary['gemini_accuracy'] = (np.mean([r['gemini'] == r['truth'] for r in compared]).round(3).item()
+                                      if compared else None)
+        summary['agreement_with_gemini'] = (np.mean([r['gemini'] == r['local'] for r in compared]).round(3).item()
+                                            if compared else None)
+        summary['agreement_when_local'] = (np.mean([r['gemini'] == r['local'] for r in compared
+                                                    if r['answered_locally']]).round(3).item()
+                                           if any(r['answered_locally'] for r in compared) else None)
+    print(json.dumps({'summary': summary, 'images': rows}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Upload decode benchmark for MedInsight AI - RadiologyAI Pro
+
+Measures time and peak RSS of the old upload path (full-resolution decode,
+rendered as-is) against image_pipeline.decode_image plus a display thumbnail,
+on large synthetic JPEG and PNG radiographs, through to prepare_for_upload. Each measurement runs
+in a fresh subprocess so peak RSS is not shared between cases, and the run
+fails if the new path exceeds the RSS budget.
+
+Run from the repository root:
+    python -m benchmarks.bench_decode --max-rss-mb 100
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+CASES = [
+    ('jpeg_rgb', 'JPEG', 6000, 7500, True),
+    ('jpeg_gray', 'JPEG', 6000, 7500, False),
+    ('png_gray', 'PNG', 4000, 5000, False),
+]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB
+
+    Uses VmHWM on Linux, because ru_maxrss survives exec and would report the
+    parent's peak in the worker subprocesses.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def worker(method, path):
+    """Decode, display and prepare one file with the given method; print timings and RSS as JSON"""
+    from PIL import Image
+    from image_pipeline import decode_image, make_thumbnail, prepare_for_upload
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    if method == 'legacy':
+        image = Image.open(path)
+        image.load()
+        display = image
+    else:
+        image = decode_image(path)
+        display = make_thumbnail(image)
+    decoded = time.perf_counter()
+    # st.image sends the bitmap to the browser as a JPEG
+    display.save(io.BytesIO(), format='JPEG')
+    displayed = time.perf_counter()
+    prepare_for_upload(image, 'xray')
+    prepared = time.perf_counter()
+    print(json.dumps({
+        'decode_s': round(decoded - started, 3),
+        'display_s': round(displayed - decoded, 3),
+        'prepare_s': round(prepared - displayed, 3),
+        'total_s': round(prepared - started, 3),
+        'analysis_size': list(image.size),
+        'display_size': list(display.size),
+        'peak_rss_delta_mb': round(peak_rss_mb() - baseline, 1),
+    }))
+
+
+def measure(method, path):
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_decode', '--worker', method, path],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-rss-mb', type=float, default=100, help='peak RSS budget per upload for the new path')
+    parser.add_argument('--worker', nargs=2, metavar=('METHOD', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    from benchmarks.bench_upload import synthetic_film
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, fmt, width, height, rgb in CASES:
+            path = os.path.join(directory, f"{name}.{fmt.lower()}")
+            synthetic_film(width, height, rgb=rgb).save(path, format=fmt)
+            results.append({
+                'case': name,
+                'source_size': [width, height],
+                'file_mb': round(os.path.getsize(path) / 1e6, 2),
+                'before': measure('legacy', path),
+                'after': measure('decode', path),
+            })
+    print(json.dumps(results, indent=2))
+
+    over_budget = [r['case'] for r in results if r['after']['peak_rss_delta_mb'] > args.max_rss_mb]
+    assert not over_budget, f"peak RSS above {args.max_rss_mb} MB for: {', '.join(over_budget)}"
+    regressed = [r['case'] for r in results if r['after']['peak_rss_delta_mb'] >= r['before']['peak_rss_delta_mb']]
+    assert not regressed, f"peak RSS not lower than the old path for: {', '.join(regressed)}"
+
+
+if __name__ == '__main__':
+    main()
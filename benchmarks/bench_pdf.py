@@ -0,0 +1,160 @@
+"""
+PDF rendering benchmark for MedInsight AI - RadiologyAI Pro
+
+Renders the same report repeatedly with the previous temp-file based renderer
+(full-resolution PNG, ReportLab defaults) and with utils.create_pdf_report
+(in-memory engine, print-resolution JPEG/Flate images, compressed pages), for
+a grayscale radiograph, the same radiograph stored as RGB and a colour image.
+It reports per-report latency, PDF size, the image encoding picked, open file
+descriptors and files/bytes left behind in the temp directory; the temp
+directory is redirected to a scratch folder for the run, so leaked files are
+counted and then removed. The run fails if the new renderer exceeds the size
+or latency budget.
+
+Run from the repository root:
+    python -m benchmarks.bench_pdf --reports 50 --max-kb 300 --max-ms 250
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+from reportlab import rl_config
+from reportlab.lib.colors import HexColor
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Image as RLImage, Paragraph, SimpleDocTemplate, Spacer
+
+from benchmarks.load_test import percentile
+from pdf_engine import print_image
+from utils import create_pdf_report
+
+REPORT_TEXT = "\n\n".join(
+    f"**Finding {i}**: Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+    f"incididunt ut labore et dolore magna aliqua." for i in range(12)
+)
+PATIENT_INFO = {"Patient ID": "BENCH-001", "Age": "54", "Gender": "Female"}
+
+
+def legacy_create_pdf_report(analysis_text, image=None, report_type="Medical Report", patient_info=None):
+    """The previous renderer: styles per call, PDF and image written to leaked temp files"""
+    use_a85 = rl_config.useA85
+    rl_config.useA85 = 1
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+    doc = SimpleDocTemplate(temp_file.name, pagesize=A4)
+    story = []
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=24,
+                                 textColor=HexColor('#1e3a8a'), spaceAfter=30, alignment=TA_CENTER)
+    heading_style = ParagraphStyle('CustomHeading', parent=styles['Heading2'], fontSize=16,
+                                   textColor=HexColor('#667eea'), spaceAfter=12, spaceBefore=12)
+    story.append(Paragraph(report_type, title_style))
+    for key, value in (patient_info or {}).items():
+        story.append(Paragraph(f"<b>{key}:</b> {value}", styles['Normal']))
+    if image:
+        img_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
+        image.save(img_temp.name, 'PNG')
+        story.append(Paragraph("Medical Image", heading_style))
+        story.append(RLImage(img_temp.name, width=4*inch, height=3*inch))
+        story.append(Spacer(1, 0.3*inch))
+    for para in analysis_text.split('\n\n'):
+        if para.strip():
+            story.append(Paragraph(para.replace('\n', '<br/>'), styles['Normal']))
+    try:
+        doc.build(story)
+    finally:
+        rl_config.useA85 = use_a85
+    with open(temp_file.name, 'rb') as f:
+        return f.read()
+
+
+def open_fds():
+    """Number of open file descriptors of this process (Linux/macOS)"""
+    for path in ('/proc/self/fd', '/dev/fd'):
+        if os.path.isdir(path):
+            return len(os.listdir(path))
+    return None
+
+
+def disk_usage(directory):
+    files = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+    return len(files), sum(os.path.getsize(path) for path in files)
+
+
+def run(renderer, reports, image):
+    scratch = tempfile.mkdtemp(prefix='bench_pdf_')
+    previous_tempdir = tempfile.tempdir
+    tempfile.tempdir = scratch
+    try:
+        fds_before = open_fds()
+        latencies = []
+        size = 0
+        for _ in range(reports):
+            started = time.perf_counter()
+            size = len(renderer(REPORT_TEXT, image, "X-ray Analysis", PATIENT_INFO))
+            latencies.append(time.perf_counter() - started)
+        fds_after = open_fds()
+        files, used = disk_usage(scratch)
+    finally:
+        tempfile.tempdir = previous_tempdir
+        shutil.rmtree(scratch, ignore_errors=True)
+    return {
+        'latency_ms': {'p50': round(percentile(latencies, 50) * 1000, 1),
+                       'p95': round(percentile(latencies, 95) * 1000, 1)},
+        'pdf_bytes': size,
+        'fds_leaked': None if fds_before is None else fds_after - fds_before,
+        'temp_files_per_report': round(files / reports, 2),
+        'temp_bytes_per_report': int(used / reports),
+    }
+
+
+def colour_image(width, height, seed=0):
+    """A grayscale sector with a colour Doppler-like overlay"""
+    from benchmarks.bench_upload import synthetic_film
+    pixels = np.asarray(synthetic_film(width, height, rgb=True, seed=seed)).copy()
+    y, x = np.mgrid[0:height, 0:width]
+    blob = (x - width / 2) ** 2 + (y - height / 2) ** 2 < (min(width, height) / 6) ** 2
+    pixels[blob] = (pixels[blob] * [1.0, 0.3, 0.2]).astype(np.uint8)
+    return Image.fromarray(pixels, 'RGB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=50, help='reports rendered per renderer')
+    parser.add_argument('--size', type=int, default=1536, help='longest side of the embedded image')
+    parser.add_argument('--max-kb', type=float, default=300, help='PDF size budget for the new renderer')
+    parser.add_argument('--max-ms', type=float, default=250, help='p50 render time budget for the new renderer')
+    args = parser.parse_args()
+
+    from benchmarks.bench_upload import synthetic_film
+    width = int(args.size * 0.8)
+    cases = [
+        ('gray', synthetic_film(width, args.size, rgb=False)),
+        ('gray_as_rgb', synthetic_film(width, args.size, rgb=True)),
+        ('colour', colour_image(width, args.size)),
+    ]
+    results = []
+    for name, image in cases:
+        _, encoding, pixel_size = print_image(image, 4 * inch, 3 * inch)
+        results.append({
+            'case': name,
+            'embedded': {'encoding': encoding, 'pixels': list(pixel_size)},
+            'before': run(legacy_create_pdf_report, args.reports, image),
+            'after': run(create_pdf_report, args.reports, image),
+        })
+    print(json.dumps(results, indent=2))
+
+    over_size = [r['case'] for r in results if r['after']['pdf_bytes'] > args.max_kb * 1024]
+    assert not over_size, f"PDF larger than {args.max_kb} KB for: {', '.join(over_size)}"
+    too_slow = [r['case'] for r in results if r['after']['latency_ms']['p50'] > args.max_ms]
+    assert not too_slow, f"p50 render time above {args.max_ms} ms for: {', '.join(too_slow)}"
+
+
+if __name__ == '__main__':
+    main()
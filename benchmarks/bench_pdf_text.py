@@ -0,0 +1,85 @@
+"""
+PDF text extraction benchmark for MedInsight AI - RadiologyAI Pro
+
+Builds a many-page text report and compares the previous extraction (every
+page, text built with repeated +=, re-run on every click) with
+pdf_text.extract_pdf_text: capped pages, page-parallel workers, and the
+content-hash cache on a second click. Reports latency, pages read and the
+slowest page.
+
+Run from the repository root:
+    python -m benchmarks.bench_pdf_text --pages 200 --workers 4
+"""
+import argparse
+import io
+import json
+import time
+
+import PyPDF2
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from pdf_text import PDF_TEXT_MAX_PAGES, PDF_TEXT_WORKERS, extract_pdf_text
+
+LINE = "Findings: no focal consolidation, effusion or pneumothorax. Cardiomediastinal silhouette within normal limits."
+
+
+def synthetic_report(pages, lines=45):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(pages):
+        text = pdf.beginText(40, 800)
+        text.setFont('Helvetica', 8)
+        for line in range(lines):
+            text.textLine(f"{page + 1}.{line + 1} {LINE}")
+        pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def legacy_extract(data):
+    """The previous extraction: every page, concatenated with +="""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+    text = ""
+    for page in pdf_reader.pages:
+        text += page.extract_text()
+    return text
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200, help='pages in the synthetic report')
+    parser.add_argument('--max-pages', type=int, default=PDF_TEXT_MAX_PAGES, help='page cap of the new extraction')
+    parser.add_argument('--workers', type=int, default=PDF_TEXT_WORKERS, help='extraction worker processes')
+    args = parser.parse_args()
+
+    data = synthetic_report(args.pages)
+    _, legacy_ms = timed(legacy_extract, data)
+    results = {'pdf_bytes': len(data), 'pages': args.pages, 'before': {'latency_ms': legacy_ms, 'pages_read': args.pages}}
+    for label, max_pages in (('after_all_pages', args.pages), ('after_capped', args.max_pages)):
+        # The first run also starts the worker pool; it is charged to the all-pages case
+        cold, cold_ms = timed(extract_pdf_text, data, max_pages=max_pages, workers=args.workers)
+        warm, warm_ms = timed(extract_pdf_text, data, max_pages=max_pages, workers=args.workers)
+        slowest = max(range(cold.pages), key=cold.page_seconds.__getitem__) if cold.pages else None
+        results[label] = {
+            'latency_ms': cold_ms,
+            'cached_latency_ms': warm_ms,
+            'cached': warm.cached,
+            'pages_read': cold.pages,
+            'truncated': cold.truncated,
+            'unread_pages': cold.unread_pages,
+            'slowest_page': None if slowest is None else {'page': slowest + 1,
+                                                          'ms': round(cold.page_seconds[slowest] * 1000, 1)},
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Upload preprocessing benchmark for MedInsight AI - RadiologyAI Pro
+
+Compares the old upload path (full-resolution lossless PNG) with
+image_pipeline.prepare_for_upload on synthetic radiograph-sized images, and
+measures end-to-end latency through the Gemini client against the stub
+backend with a simulated upload bandwidth.
+
+Run from the repository root:
+    python -m benchmarks.bench_upload --bandwidth 2000000
+"""
+import argparse
+import io
+import json
+import os
+import time
+
+os.environ.setdefault('GEMINI_RATE_LIMIT_DB', '')
+os.environ.setdefault('GEMINI_RPM', '100000')
+os.environ.setdefault('GEMINI_TPM', '100000000')
+
+import numpy as np
+from PIL import Image
+
+from gemini_client import generate_content_async, run_sync
+from image_pipeline import prepare_for_upload
+from inference_backends import StubBackend, set_backend
+
+
+def synthetic_film(width, height, rgb=True, seed=0):
+    """A smooth radiograph-like image with film grain, optionally stored as RGB"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    body = np.exp(-(((x - width / 2) / (width / 3)) ** 2 + ((y - height / 2) / (height / 2.5)) ** 2))
+    ribs = 0.15 * np.sin(y / max(1, height / 40)) * body
+    pixels = np.clip(40 + 180 * body + 60 * ribs + rng.normal(0, 4, body.shape), 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels, 'L')
+    return image.convert('RGB') if rgb else image
+
+
+def legacy_encode(image):
+    """The previous upload path: full-resolution lossless PNG"""
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue(), 'image/png'
+
+
+def timed_request(payload, mime_type):
+    started = time.perf_counter()
+    run_sync(generate_content_async(['Describe this image', {'mime_type': mime_type, 'data': payload}],
+                                    deadline=300))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bandwidth', type=float, default=2_000_000, help='simulated upload bytes per second')
+    parser.add_argument('--latency', type=float, default=1.0, help='stub model latency in seconds')
+    args = parser.parse_args()
+
+    set_backend(StubBackend(latency_median=args.latency, latency_sigma=0.0001, upload_bandwidth=args.bandwidth))
+    cases = [
+        ('xray', synthetic_film(4000, 5000)),
+        ('ct', synthetic_film(2048, 2048)),
+        ('ultrasound', synthetic_film(1280, 960, rgb=True)),
+    ]
+    results = []
+    for modality, image in cases:
+        started = time.perf_counter()
+        before_bytes, before_mime = legacy_encode(image)
+        before_encode = time.perf_counter() - started
+
+        started = time.perf_counter()
+        encoded = prepare_for_upload(image, modality)
+        after_encode = time.perf_counter() - started
+
+        before_total = before_encode + timed_request(before_bytes, before_mime)
+        after_total = after_encode + timed_request(encoded.data, encoded.mime_type)
+        results.append({
+            'modality': modality,
+            'source_size': list(image.size),
+            'before': {'bytes': len(before_bytes), 'mime_type': before_mime,
+                       'encode_s': round(before_encode, 3), 'end_to_end_s': round(before_total, 3)},
+            'after': {'bytes': len(encoded.data), 'mime_type': encoded.mime_type, 'size': list(encoded.size),
+                      'mode': encoded.mode, 'encode_s': round(after_encode, 3), 'end_to_end_s': round(after_total, 3)},
+            'bytes_saved': f"{1 - len(encoded.data) / len(before_bytes):.1%}",
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Offline load test for MedInsight AI - RadiologyAI Pro
+
+Drives generate_report_with_retry from many concurrent "sessions" against the
+stub inference backend and reports throughput, latency percentiles, retries
+and model health. No network access or API quota is used.
+
+Run from the repository root:
+    python -m benchmarks.load_test --sessions 20 --requests 5 --rate-429 0.2
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Keep the load test away from the real cache and rate limit stores
+os.environ.setdefault('REPORT_CACHE_PATH', os.path.join(tempfile.mkdtemp(), 'report_cache.sqlite3'))
+os.environ.setdefault('GEMINI_RATE_LIMIT_DB', '')
+os.environ.setdefault('GEMINI_RPM', '100000')
+os.environ.setdefault('GEMINI_TPM', '100000000')
+
+from PIL import Image
+
+from circuit_breaker import health_snapshot
+from gemini_client import hedge_stats, single_flight_stats
+from inference_backends import StubBackend, set_backend
+from utils import generate_report_with_retry
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run_load_test(sessions, requests_per_session, unique=True, base_delay=0.5):
+    """Run the load test against the currently configured backend and return a summary"""
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    image = Image.new('L', (512, 512), 128)
+
+    def session(session_id):
+        for request_id in range(requests_per_session):
+            prompt = f"Load test prompt {session_id}-{request_id}" if unique else "Load test prompt"
+            started = time.perf_counter()
+            result = generate_report_with_retry(image, prompt, base_delay=base_delay)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if result is None:
+                    failures.append((session_id, request_id))
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'failures': len(failures),
+        'wall_time_s': round(wall_time, 2),
+        'throughput_rps': round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+        'latency_s': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(max(latencies, default=0.0), 3),
+        },
+        'single_flight': single_flight_stats(),
+        'hedging': hedge_stats(),
+        'model_health': health_snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=20, help='concurrent sessions')
+    parser.add_argument('--requests', type=int, default=5, help='requests per session')
+    parser.add_argument('--latency-median', type=float, default=1.0, help='median stub latency in seconds')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='log-normal sigma of stub latency')
+    parser.add_argument('--rate-429', type=float, default=0.05, help='probability of a 429 response')
+    parser.add_argument('--rate-500', type=float, default=0.02, help='probability of a 500 response')
+    parser.add_argument('--base-delay', type=float, default=0.5, help='retry base delay in seconds')
+    parser.add_argument('--identical', action='store_true', help='send the same prompt from every session')
+    parser.add_argument('--seed', type=int, default=0, help='stub random seed')
+    args = parser.parse_args()
+
+    backend = StubBackend(latency_median=args.latency_median, latency_sigma=args.latency_sigma,
+                          rate_429=args.rate_429, rate_500=args.rate_500, seed=args.seed)
+    set_backend(backend)
+    summary = run_load_test(args.sessions, args.requests, unique=not args.identical, base_delay=args.base_delay)
+    summary['backend'] = backend.stats()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Bulk report export for MedInsight AI - RadiologyAI Pro
+
+Renders archived reports to PDF in a process pool (ReportLab is CPU-bound and
+holds the GIL) and streams them into a ZIP archive as they finish, so memory
+stays bounded by the number of reports in flight rather than the batch size.
+The ZIP is checkpointed every EXPORT_CHUNK reports: the archive is closed, so
+it is valid on disk, and its central directory is saved next to it. An
+interrupted export resumes from the last checkpoint and skips every report
+already in the ZIP; running an export again into a finished ZIP only adds
+reports that are not in it yet.
+
+Run from the repository root:
+    python -m bulk_export --out reports_2026-10-18.zip --day 2026-10-18
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from report_archive import REPORT_ARCHIVE_PATH, ReportArchive
+
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', os.cpu_count() or 2))
+# Reports written between checkpoints; a crash loses at most this much work
+EXPORT_CHUNK = int(os.getenv('EXPORT_CHUNK', 25))
+EXPORT_DIR = os.getenv('EXPORT_DIR', os.path.join(os.path.expanduser('~'), '.medinsight', 'exports'))
+
+ExportResult = namedtuple('ExportResult', ['path', 'exported', 'skipped', 'failed', 'seconds'])
+
+_worker_archive = None
+
+
+def checkpoint_path(zip_path):
+    return zip_path + '.checkpoint'
+
+
+def entry_name(report):
+    """ZIP entry name of a report: date, report type and archive id"""
+    created = datetime.fromtimestamp(report['created_at']).strftime('%Y%m%d_%H%M%S')
+    report_type = re.sub(r'[^a-z0-9]+', '_', report['report_type'].lower()).strip('_')
+    return f"{created}_{report_type}_{report['id']}.pdf"
+
+
+def entry_report_id(name):
+    match = re.search(r'_(\d+)\.pdf$', name)
+    return int(match.group(1)) if match else None
+
+
+def _init_worker(archive_path):
+    global _worker_archive
+    _worker_archive = ReportArchive(archive_path)
+
+
+def _render_report(report_id):
+    """Render one archived report in a worker process; returns (report id, entry name, PDF bytes)"""
+    from utils import create_pdf_report
+
+    report = _worker_archive.load(report_id)
+    if report is None:
+        raise LookupError(f"report {report_id} is not in the archive")
+    pdf = create_pdf_report(report['report_text'], report['image'], report['report_type'], report['patient_info'])
+    if pdf is None:
+        raise RuntimeError(f"report {report_id} could not be rendered")
+    return report_id, entry_name(report), pdf
+
+
+def _save_checkpoint(zip_path):
+    """Record the valid end of a closed ZIP: where its central directory starts, and the directory itself"""
+    with zipfile.ZipFile(zip_path) as archive:
+        offset = archive.start_dir
+    with open(zip_path, 'rb') as handle:
+        handle.seek(offset)
+        tail = handle.read()
+    temporary = checkpoint_path(zip_path) + '.tmp'
+    with open(temporary, 'w') as handle:
+        json.dump({'offset': offset, 'tail': base64.b64encode(tail).decode('ascii')}, handle)
+    os.replace(temporary, checkpoint_path(zip_path))
+
+
+def _restore_checkpoint(zip_path):
+    """Cut an interrupted ZIP back to its last checkpoint, dropping the half-written chunk"""
+    with open(checkpoint_path(zip_path)) as handle:
+        checkpoint = json.load(handle)
+    with open(zip_path, 'r+b') as handle:
+        handle.truncate(checkpoint['offset'])
+        handle.seek(checkpoint['offset'])
+        handle.write(base64.b64decode(checkpoint['tail']))
+
+
+def _open_export(zip_path, restart):
+    """Prepare the ZIP for appending and return the ids of the reports already in it"""
+    if restart:
+        for path in (zip_path, checkpoint_path(zip_path)):
+            if os.path.exists(path):
+                os.remove(path)
+    directory = os.path.dirname(zip_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if not os.path.exists(zip_path):
+        zipfile.ZipFile(zip_path, 'w').close()
+    elif os.path.exists(checkpoint_path(zip_path)):
+        _restore_checkpoint(zip_path)
+    with zipfile.ZipFile(zip_path) as archive:
+        done = {entry_report_id(name) for name in archive.namelist()}
+    _save_checkpoint(zip_path)
+    return done - {None}
+
+
+def export_reports(report_ids, zip_path, workers=EXPORT_WORKERS, chunk=EXPORT_CHUNK,
+                   archive_path=REPORT_ARCHIVE_PATH, restart=False, progress=None):
+    """Render the given archived reports into zip_path, resuming an earlier run into the same file
+
+    progress, if given, is called as progress(done, total) after every report,
+    counting reports already in the ZIP. Reports that fail to render are left
+    out and returned in ExportResult.failed ({id: error}); run the export again
+    to retry them.
+    """
+    started = time.perf_counter()
+    report_ids = list(dict.fromkeys(report_ids))
+    done = _open_export(zip_path, restart)
+    todo = [report_id for report_id in report_ids if report_id not in done]
+    total = len(report_ids)
+    completed = total - len(todo)
+    exported = 0
+    failed = {}
+    if progress:
+        progress(completed, total)
+
+    pending = iter(todo)
+    in_flight = set()
+    archive = zipfile.ZipFile(zip_path, 'a')
+    since_checkpoint = 0
+    try:
+        # spawn: forking a threaded server process can deadlock the child
+        with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(archive_path,)) as pool:
+            futures = {}
+            while True:
+                # Keep a small window in flight so finished PDFs never pile up in memory
+                while len(in_flight) < max(1, workers) * 2:
+                    report_id = next(pending, None)
+                    if report_id is None:
+                        break
+                    future = pool.submit(_render_report, report_id)
+                    futures[future] = report_id
+                    in_flight.add(future)
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    report_id = futures.pop(future)
+                    try:
+                        _, name, pdf = future.result()
+                    except Exception as e:
+                        failed[report_id] = str(e)
+                    else:
+                        # PDF streams are already compressed; deflating them again only costs time
+                        archive.writestr(name, pdf, compress_type=zipfile.ZIP_STORED)
+                        exported += 1
+                        since_checkpoint += 1
+                    completed += 1
+                    if progress:
+                        progress(completed, total)
+                if since_checkpoint >= chunk:
+                    archive.close()
+                    _save_checkpoint(zip_path)
+                    archive = zipfile.ZipFile(zip_path, 'a')
+                    since_checkpoint = 0
+    finally:
+        archive.close()
+    # The ZIP is complete and valid; the checkpoint is only needed while an export is unfinished
+    os.remove(checkpoint_path(zip_path))
+    return ExportResult(zip_path, exported, total - len(todo), failed, time.perf_counter() - started)
+
+
+def day_range(day):
+    """Unix time bounds [start, end) of a local calendar day"""
+    start = datetime.combine(day, datetime.min.time())
+    return start.timestamp(), (start + timedelta(days=1)).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='ZIP file to write or resume')
+    parser.add_argument('--day', help='export the reports archived on this day (YYYY-MM-DD)')
+    parser.add_argument('--report-type', help='only export this report type, e.g. "X-ray Analysis"')
+    parser.add_argument('--ids', type=int, nargs='+', help='export these archive ids instead')
+    parser.add_argument('--workers', type=int, default=EXPORT_WORKERS, help='rendering processes')
+    parser.add_argument('--chunk', type=int, default=EXPORT_CHUNK, help='reports written between checkpoints')
+    parser.add_argument('--archive', default=REPORT_ARCHIVE_PATH, help='report archive database')
+    parser.add_argument('--restart', action='store_true', help='discard an existing ZIP instead of resuming it')
+    args = parser.parse_args()
+
+    if args.ids:
+        report_ids = args.ids
+    else:
+        since, until = day_range(datetime.strptime(args.day, '%Y-%m-%d').date()) if args.day else (None, None)
+        report_ids = ReportArchive(args.archive).ids(since, until, args.report_type)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} reports", end='', file=sys.stderr, flush=True)
+
+    result = export_reports(report_ids, args.out, args.workers, args.chunk, args.archive, args.restart, progress)
+    print(file=sys.stderr)
+    print(json.dumps(result._asdict(), indent=2))
+    if result.failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Model circuit breakers for MedInsight AI - RadiologyAI Pro
+
+Tracks the recent error rate and EWMA latency of every Gemini model. A model
+that keeps failing (or is too slow) is opened and skipped by the fallback
+chain until a cool-down passes, after which a single probe request decides
+whether it closes again.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+# Circuit breaker configuration (overridable from the environment)
+BREAKER_WINDOW = float(os.getenv('BREAKER_WINDOW', 60))
+BREAKER_MIN_REQUESTS = int(os.getenv('BREAKER_MIN_REQUESTS', 4))
+BREAKER_ERROR_RATE = float(os.getenv('BREAKER_ERROR_RATE', 0.5))
+BREAKER_SLOW_LATENCY = float(os.getenv('BREAKER_SLOW_LATENCY', 30))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', 30))
+BREAKER_EWMA_ALPHA = 0.3
+LATENCY_SAMPLES = 100
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for a single model"""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.state = CLOSED
+        self.opened_at = None
+        self.ewma_latency = None
+        self.successes = 0
+        self.failures = 0
+        self._outcomes = deque()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > BREAKER_WINDOW:
+            self._outcomes.popleft()
+
+    def _error_rate(self):
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self._probe_in_flight = False
+
+    def allow_request(self):
+        """Return True if a request may be sent to this model now"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                if now - self.opened_at < BREAKER_COOLDOWN:
+                    return False
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def release(self):
+        """Give back a half-open probe slot that ended up not being used"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_result(self, ok, latency=None):
+        """Record the outcome of a request and update the breaker state"""
+        now = time.monotonic()
+        with self._lock:
+            if latency is not None:
+                if self.ewma_latency is None:
+                    self.ewma_latency = latency
+                else:
+                    self.ewma_latency = BREAKER_EWMA_ALPHA * latency + (1 - BREAKER_EWMA_ALPHA) * self.ewma_latency
+            if ok:
+                self.successes += 1
+                if latency is not None:
+                    self._latencies.append(latency)
+            else:
+                self.failures += 1
+            self._outcomes.append((now, ok))
+            self._trim(now)
+
+            if self.state == HALF_OPEN:
+                # The probe decides: close on success, re-open on failure
+                self._probe_in_flight = False
+                if ok:
+                    self.state = CLOSED
+                    self.opened_at = None
+                    self._outcomes.clear()
+                    self.ewma_latency = latency
+                else:
+                    self._open(now)
+                return
+
+            too_many_errors = (len(self._outcomes) >= BREAKER_MIN_REQUESTS
+                               and self._error_rate() >= BREAKER_ERROR_RATE)
+            too_slow = self.ewma_latency is not None and self.ewma_latency > BREAKER_SLOW_LATENCY
+            if self.state == CLOSED and (too_many_errors or too_slow):
+                self._open(now)
+
+    def latency_percentile(self, percentile, min_samples=1):
+        """Return the given percentile of recent successful latencies, or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < min_samples or not samples:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        """Return the breaker state as a JSON-serialisable dict"""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = round(max(0.0, BREAKER_COOLDOWN - (now - self.opened_at)), 1)
+            return {
+                'state': self.state,
+                'error_rate': round(self._error_rate(), 3),
+                'recent_requests': len(self._outcomes),
+                'ewma_latency_ms': None if self.ewma_latency is None else round(self.ewma_latency * 1000),
+                'retry_in_s': retry_in,
+                'successes': self.successes,
+                'failures': self.failures,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model_name):
+    """Return the process-wide circuit breaker for a model"""
+    with _breakers_lock:
+        breaker = _breakers.get(model_name)
+        if breaker is None:
+            breaker = _breakers[model_name] = CircuitBreaker(model_name)
+        return breaker
+
+
+def health_snapshot():
+    """Return the state of every model's breaker, keyed by model name"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.model_name: breaker.snapshot() for breaker in breakers}
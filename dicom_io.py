@@ -0,0 +1,172 @@
+"""
+DICOM ingestion for MedInsight AI - RadiologyAI Pro
+
+Reads DICOM headers without touching pixel data, decodes pixels lazily one
+frame at a time, and converts them to 8-bit PIL images with the modality LUT
+(rescale slope/intercept) and the VOI LUT or window center/width applied. The
+Modality tag is carried in image.info so pages can route the study.
+"""
+import numpy as np
+from PIL import Image
+from image_pipeline import window_to_uint8
+
+try:
+    import pydicom
+    from pydicom.pixels import iter_pixels, pixel_array
+except ImportError:  # pydicom (3.0 or later) is optional; DICOM uploads report a clear error without it
+    pydicom = None
+
+DICOM_EXTENSIONS = ('.dcm', '.dicom')
+
+# DICOM Modality (0008,0060) codes and the report page that handles them
+DICOM_MODALITY_PAGES = {
+    'CR': 'xray',
+    'DX': 'xray',
+    'MG': 'xray',
+    'RF': 'xray',
+    'XA': 'xray',
+    'IO': 'xray',
+    'PX': 'xray',
+    'CT': 'ct',
+    'MR': 'mri',
+    'US': 'ultrasound',
+}
+
+
+def _require_pydicom():
+    if pydicom is None:
+        raise ImportError("DICOM support requires the 'pydicom' package, version 3.0 or later (pip install 'pydicom>=3.0')")
+
+
+def _first(value, default=None):
+    """Return the first value of a possibly multi-valued DICOM element"""
+    if value is None or value == '':
+        return default
+    if isinstance(value, (list, tuple)) or type(value).__name__ == 'MultiValue':
+        return value[0] if len(value) else default
+    return value
+
+
+def is_dicom(uploaded_file):
+    """Return True if an uploaded file is DICOM, by extension or the 'DICM' preamble marker"""
+    name = (getattr(uploaded_file, 'name', '') or '').lower()
+    if name.endswith(DICOM_EXTENSIONS):
+        return True
+    position = uploaded_file.tell()
+    try:
+        uploaded_file.seek(128)
+        return uploaded_file.read(4) == b'DICM'
+    finally:
+        uploaded_file.seek(position)
+
+
+def read_dicom_header(src):
+    """Read the DICOM dataset without loading the pixel data"""
+    _require_pydicom()
+    position = src.tell() if hasattr(src, 'tell') else None
+    ds = pydicom.dcmread(src, stop_before_pixels=True, force=True)
+    if position is not None:
+        src.seek(position)
+    return ds
+
+
+def slice_position(ds):
+    """Position of a slice along its series axis, for sorting slices into anatomical order
+
+    Uses ImagePositionPatient projected on the slice normal (from
+    ImageOrientationPatient), falling back to InstanceNumber; None if neither
+    is present.
+    """
+    position = ds.get('ImagePositionPatient')
+    orientation = ds.get('ImageOrientationPatient')
+    try:
+        if position is not None and orientation is not None and len(orientation) == 6:
+            normal = np.cross(np.array(orientation[:3], dtype=float), np.array(orientation[3:], dtype=float))
+            return float(np.dot(normal, np.array(position, dtype=float)))
+        instance = ds.get('InstanceNumber')
+        return float(instance) if instance not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def modality_page(ds):
+    """Return the report page ('xray', 'ct', 'mri', 'ultrasound') for a dataset, or None"""
+    return DICOM_MODALITY_PAGES.get(str(ds.get('Modality', '')).upper())
+
+
+def _apply_voi_lut_sequence(values, item):
+    """Map values through the first item of a VOI LUT Sequence, scaled to 0-255"""
+    entries, first_mapped, bits = (int(x) for x in item.LUTDescriptor)
+    lut = item.LUTData
+    if isinstance(lut, bytes):
+        lut = np.frombuffer(lut, dtype=np.uint16 if bits > 8 else np.uint8)
+    lut = np.asarray(lut, dtype=np.float32)[:entries or 65536]
+    index = np.rint(values - first_mapped)
+    np.clip(index, 0, len(lut) - 1, out=index)
+    out = lut[index.astype(np.intp)]
+    out *= 255.0 / max(2 ** bits - 1, 1)
+    return out.astype(np.uint8)
+
+
+def frame_to_uint8(frame, ds):
+    """Convert one decoded frame to an 8-bit array using the dataset's LUTs"""
+    if frame.ndim == 3:
+        # Colour data (RGB, or YBR already converted to RGB by pydicom)
+        if frame.dtype != np.uint8:
+            bits = int(ds.get('BitsStored', 8) or 8)
+            frame = (frame.astype(np.float32) * (255.0 / (2 ** bits - 1))).astype(np.uint8)
+        return frame
+
+    values = frame.astype(np.float32)
+    slope = float(_first(ds.get('RescaleSlope'), 1) or 1)
+    intercept = float(_first(ds.get('RescaleIntercept'), 0) or 0)
+    if slope != 1:
+        values *= slope
+    if intercept != 0:
+        values += intercept
+
+    voi_sequence = ds.get('VOILUTSequence')
+    center = _first(ds.get('WindowCenter'))
+    width = _first(ds.get('WindowWidth'))
+    if voi_sequence:
+        out = _apply_voi_lut_sequence(values, voi_sequence[0])
+    elif center is not None and width is not None:
+        out = window_to_uint8(values, float(center), float(width))
+    else:
+        # No window in the header: stretch the frame's own range
+        low, high = float(values.min()), float(values.max())
+        out = window_to_uint8(values, (low + high) / 2 + 0.5, max(high - low, 1.0) + 1)
+
+    if str(ds.get('PhotometricInterpretation', '')).upper() == 'MONOCHROME1':
+        np.subtract(255, out, out=out)
+    return out
+
+
+def _to_image(frame, ds, index, frames):
+    array = frame_to_uint8(frame, ds)
+    image = Image.fromarray(array, 'RGB' if array.ndim == 3 else 'L')
+    image.info['dicom_modality'] = str(ds.get('Modality', '')).upper() or None
+    image.info['dicom_frames'] = frames
+    image.info['dicom_frame_index'] = index
+    return image
+
+
+def frame_count(ds):
+    return int(ds.get('NumberOfFrames', 1) or 1)
+
+
+def load_dicom_image(src, frame=None):
+    """Decode a single frame (the middle one by default) of a DICOM file to a PIL image"""
+    ds = read_dicom_header(src)
+    frames = frame_count(ds)
+    index = frames // 2 if frame is None else frame
+    data = pixel_array(src, index=index if frames > 1 else None)
+    return _to_image(data, ds, index, frames)
+
+
+def iter_dicom_frames(src):
+    """Yield every frame of a DICOM file as a PIL image, decoding one frame at a time"""
+    ds = read_dicom_header(src)
+    frames = frame_count(ds)
+    for index, data in enumerate(iter_pixels(src)):
+        yield _to_image(data, ds, index, frames)
@@ -0,0 +1,450 @@
+"""
+Asynchronous Gemini client for MedInsight AI - RadiologyAI Pro
+
+All Gemini requests run on one background asyncio event loop shared by every
+Streamlit session in the process. A global semaphore bounds the number of
+requests in flight, and retry backoff uses asyncio.sleep so a waiting request
+does not hold a thread or a concurrency slot.
+"""
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from google.api_core import exceptions as api_exceptions
+from circuit_breaker import get_breaker
+from inference_backends import get_backend
+from rate_limiter import estimate_tokens, get_rate_limiter
+
+# Maximum number of Gemini requests in flight across all sessions of this process
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', 8))
+
+# Total wall-time budget of one generation call, across all retries and models
+GEMINI_DEADLINE = float(os.getenv('GEMINI_DEADLINE', 90))
+# A retry is only worth sleeping for if at least this much budget is left afterwards
+GEMINI_MIN_ATTEMPT_TIME = float(os.getenv('GEMINI_MIN_ATTEMPT_TIME', 5))
+
+# Hedged requests: if the first model has not answered within this percentile of
+# its recent latency, send the same request to the next model and keep the winner
+GEMINI_HEDGE = os.getenv('GEMINI_HEDGE', '0').lower() in ('1', 'true', 'yes')
+GEMINI_HEDGE_PERCENTILE = float(os.getenv('GEMINI_HEDGE_PERCENTILE', 95))
+GEMINI_HEDGE_DEFAULT_DELAY = float(os.getenv('GEMINI_HEDGE_DEFAULT_DELAY', 15))
+GEMINI_HEDGE_MAX_RATIO = float(os.getenv('GEMINI_HEDGE_MAX_RATIO', 0.1))
+HEDGE_MIN_SAMPLES = 10
+
+# Models to fall back to, in order, after the requested one
+FALLBACK_MODELS = [
+    'gemini-2.0-flash-lite',
+    'gemini-2.5-flash-lite',
+    'gemini-flash-latest',
+    'gemini-pro-latest'
+]
+
+
+class GenerationError(Exception):
+    """Raised when no model in the fallback chain produced a response"""
+
+    def __init__(self, message, last_error=None):
+        super().__init__(message)
+        self.last_error = last_error
+
+
+class DeadlineExceededError(GenerationError):
+    """Raised when a generation call used up its whole deadline budget"""
+
+
+class Deadline:
+    """Absolute deadline shared by every attempt of one generation call"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0.0
+
+
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+FATAL = 'fatal'
+
+_RATE_LIMIT_ERRORS = (api_exceptions.TooManyRequests,)
+_TRANSIENT_ERRORS = (
+    api_exceptions.ServerError,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.RetryError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+def classify_error(error):
+    """Classify an exception as RATE_LIMITED, TRANSIENT or FATAL by its type"""
+    if isinstance(error, _RATE_LIMIT_ERRORS):
+        return RATE_LIMITED
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return TRANSIENT
+    return FATAL
+
+
+def fallback_models(model_name):
+    """Return the requested model followed by the fallback chain, without duplicates"""
+    seen = set()
+    return [x for x in [model_name] + FALLBACK_MODELS if not (x in seen or seen.add(x))]
+
+
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+
+
+def warm_up(model_name='gemini-2.0-flash-lite'):
+    """Create the model handles of the fallback chain and start the client loop"""
+    get_backend().warm_up(fallback_models(model_name))
+    get_event_loop()
+
+
+def get_event_loop():
+    """Return the shared client event loop, starting its thread on first use"""
+    global _loop, _semaphore
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='gemini-client', daemon=True)
+                thread.start()
+                _semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared client loop and block until it finishes"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+_STREAM_DONE = object()
+
+
+def stream_sync(contents, model_name='gemini-2.0-flash-lite', max_retries=3, base_delay=2, flight_key=None,
+                deadline=None):
+    """Stream a generation from the calling thread
+
+    Yields the accumulated response text each time a chunk arrives (an empty
+    string means a failed attempt was discarded and a retry is starting). The
+    generator's return value is the final (text, model name) tuple.
+    """
+    updates = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        generate_content_async(contents, model_name, max_retries, base_delay, on_text=updates.put,
+                               flight_key=flight_key, deadline=deadline),
+        get_event_loop()
+    )
+    future.add_done_callback(lambda _: updates.put(_STREAM_DONE))
+    while True:
+        update = updates.get()
+        if update is _STREAM_DONE:
+            break
+        yield update
+    return future.result()
+
+
+_hedge_stats = {'requests': 0, 'hedges_fired': 0, 'hedges_won': 0, 'skipped_budget': 0, 'skipped_fallen_through': 0}
+
+
+def hedge_stats():
+    """Return counters describing how often hedged requests fired and won"""
+    stats = dict(_hedge_stats)
+    stats['enabled'] = GEMINI_HEDGE
+    stats['win_rate'] = stats['hedges_won'] / stats['hedges_fired'] if stats['hedges_fired'] else 0.0
+    return stats
+
+
+def hedge_delay(model_name):
+    """Seconds to wait on a model before hedging, from its recent latency percentile"""
+    delay = get_breaker(model_name).latency_percentile(GEMINI_HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    return GEMINI_HEDGE_DEFAULT_DELAY if delay is None else delay
+
+
+class _Flight:
+    """An in-flight request that identical concurrent requests wait on"""
+
+    def __init__(self):
+        self.task = None
+        self.text = ''
+        self.listeners = []
+
+    def publish(self, text):
+        self.text = text
+        for listener in self.listeners:
+            listener(text)
+
+
+_flights = {}
+_single_flight_stats = {'leaders': 0, 'coalesced': 0}
+
+
+def single_flight_stats():
+    """Return how many requests were sent and how many joined an identical in-flight one"""
+    return dict(_single_flight_stats)
+
+
+async def generate_content_async(contents, model_name='gemini-2.0-flash-lite', max_retries=3, base_delay=2,
+                                 on_text=None, hedge=None, flight_key=None, deadline=None):
+    """Generate content with non-blocking retries and model fallback
+
+    When on_text is given the response is streamed and on_text is called with
+    the accumulated text after every chunk, and with an empty string when a
+    partially streamed attempt fails and is retried.
+
+    With hedging (hedge=True, or GEMINI_HEDGE by default) a slow first model
+    is raced against the rest of the chain and the first answer wins.
+
+    Concurrent calls with the same flight_key (a fingerprint of the request)
+    share a single in-flight generation and its result.
+
+    The whole call, including every retry, backoff and fallback, must finish
+    within deadline seconds (GEMINI_DEADLINE by default).
+
+    Returns a (text, model name) tuple. Raises DeadlineExceededError when the
+    budget runs out, or GenerationError once every model has been exhausted.
+    """
+    deadline = Deadline(GEMINI_DEADLINE if deadline is None else deadline)
+    if flight_key is None:
+        return await _generate(contents, model_name, max_retries, base_delay, on_text, hedge, deadline)
+
+    flight = _flights.get(flight_key)
+    if flight is None:
+        flight = _Flight()
+        flight.task = asyncio.ensure_future(_generate(
+            contents, model_name, max_retries, base_delay, flight.publish if on_text is not None else None, hedge,
+            deadline
+        ))
+        _flights[flight_key] = flight
+
+        def finish(_):
+            if _flights.get(flight_key) is flight:
+                del _flights[flight_key]
+        flight.task.add_done_callback(finish)
+        _single_flight_stats['leaders'] += 1
+    else:
+        _single_flight_stats['coalesced'] += 1
+
+    if on_text is not None:
+        flight.listeners.append(on_text)
+        if flight.text:
+            on_text(flight.text)
+    # Shielded so one caller going away does not cancel the request for the others
+    return await asyncio.shield(flight.task)
+
+
+async def _generate(contents, model_name, max_retries, base_delay, on_text, hedge, deadline):
+    """Dispatch to the hedged or plain fallback strategy"""
+    models = fallback_models(model_name)
+    hedge = GEMINI_HEDGE if hedge is None else hedge
+    if hedge and len(models) > 1:
+        return await _generate_hedged(contents, models, max_retries, base_delay, on_text, deadline)
+    return await _generate_with_fallback(contents, models, max_retries, base_delay, on_text, deadline)
+
+
+async def _generate_hedged(contents, models, max_retries, base_delay, on_text, deadline):
+    """Race the first model against the rest of the fallback chain once it is slow
+
+    Once the hedge fires the primary stays on models[0] and the secondary walks
+    models[1:], so the two never send the same request to the same model. If the
+    primary has already fallen through past models[0], there is nothing to hedge.
+    """
+    _hedge_stats['requests'] += 1
+    primary_models = list(models)
+    progress = {'index': 0}
+    owner = []
+    first_text = asyncio.Event()
+
+    def forward(index):
+        # While streaming, the first racer to produce text owns the placeholder
+        if on_text is None:
+            return None
+
+        def on_racer_text(text):
+            if not owner and text:
+                owner.append(index)
+                first_text.set()
+            if owner and owner[0] == index:
+                on_text(text)
+        return on_racer_text
+
+    primary = asyncio.ensure_future(
+        _generate_with_fallback(contents, primary_models, max_retries, base_delay, forward(0), deadline, progress)
+    )
+    secondary = None
+    text_waiter = asyncio.ensure_future(first_text.wait())
+    try:
+        await asyncio.wait({primary, text_waiter}, timeout=min(hedge_delay(models[0]), deadline.remaining()),
+                           return_when=asyncio.FIRST_COMPLETED)
+        if primary.done() or first_text.is_set():
+            return await primary
+
+        # Cap the extra spend at GEMINI_HEDGE_MAX_RATIO hedges per request
+        if _hedge_stats['hedges_fired'] >= GEMINI_HEDGE_MAX_RATIO * _hedge_stats['requests']:
+            _hedge_stats['skipped_budget'] += 1
+            return await primary
+
+        if progress['index'] > 0:
+            # models[0] is open or failed fast; the primary is already on the models a hedge would use
+            _hedge_stats['skipped_fallen_through'] += 1
+            return await primary
+
+        _hedge_stats['hedges_fired'] += 1
+        # The primary's chain is read as it goes, so it ends after models[0]
+        del primary_models[1:]
+        secondary = asyncio.ensure_future(
+            _generate_with_fallback(contents, models[1:], max_retries, base_delay, forward(1), deadline)
+        )
+        racers = [primary, secondary]
+        pending = set(racers)
+        winner = None
+        while pending and winner is None:
+            watch = pending if text_waiter.done() else pending | {text_waiter}
+            done, _ = await asyncio.wait(watch, return_when=asyncio.FIRST_COMPLETED)
+            if owner:
+                winner = racers[owner[0]]
+                break
+            for task in done & pending:
+                pending.discard(task)
+                if task.exception() is None:
+                    winner = task
+                    break
+
+        if winner is None:
+            # Both racers exhausted their chains; report the primary's failure
+            return await primary
+        if winner is secondary:
+            _hedge_stats['hedges_won'] += 1
+        return await winner
+    finally:
+        text_waiter.cancel()
+        for task in (primary, secondary):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def _generate_with_fallback(contents, models, max_retries, base_delay, on_text, deadline, progress=None):
+    """Walk the model chain with retries, rate limiting and circuit breakers
+
+    Each attempt may use whatever budget is left, but a model is only retried
+    while it stays within its fair share of the remaining budget (split evenly
+    over the models still to try) and a useful attempt still fits after the
+    backoff; otherwise the chain moves straight on to the next model. progress,
+    if given, is kept updated with the index of the model being tried.
+    """
+    last_error = None
+    limiter = get_rate_limiter()
+    backend = get_backend()
+    tokens = estimate_tokens(contents)
+
+    for index, current_model_name in enumerate(models):
+        if deadline.expired():
+            break
+        if progress is not None:
+            progress['index'] = index
+        breaker = get_breaker(current_model_name)
+        try:
+            model = backend.get_model(current_model_name)
+        except Exception as e:
+            last_error = e
+            continue
+
+        model_share = deadline.remaining() / (len(models) - index)
+        model_started = time.monotonic()
+
+        for attempt in range(max_retries + 1):
+            # Skip models whose circuit is open
+            if not breaker.allow_request():
+                break
+
+            # Everything after allow_request() may be cut short (rate limit queue, a lost
+            # hedged race, the deadline); a half-open probe slot that never produced a
+            # result must be given back, or the breaker stays half-open for good
+            recorded = False
+            try:
+                # Queue for rate limit capacity; move on if this model is saturated
+                if not await limiter.acquire(current_model_name, tokens,
+                                             max_wait=min(limiter.max_wait, deadline.remaining())):
+                    break
+
+                # Latency is measured from when a local concurrency slot is held, so queueing
+                # behind other sessions is never charged to the model
+                timing = {'started': None}
+                streamed = []
+
+                async def attempt_once():
+                    async with _semaphore:
+                        timing['started'] = time.monotonic()
+                        if on_text is None:
+                            response = await model.generate_content_async(contents)
+                            return response.text
+                        response = await model.generate_content_async(contents, stream=True)
+                        text = ''
+                        async for chunk in response:
+                            text += chunk.text
+                            streamed.append(True)
+                            on_text(text)
+                        return text
+
+                try:
+                    text = await asyncio.wait_for(attempt_once(), timeout=deadline.remaining())
+                    breaker.record_result(True, time.monotonic() - timing['started'])
+                    recorded = True
+                    if text:
+                        return text, current_model_name
+
+                except Exception as e:
+                    if streamed:
+                        # Discard the partial output of the failed stream
+                        on_text('')
+                    last_error = e
+                    if timing['started'] is None:
+                        # The deadline ran out while queued for a local slot; the model was never asked
+                        break
+                    latency = time.monotonic() - timing['started']
+                    kind = classify_error(e)
+
+                    if kind == FATAL:
+                        # Blocked content or a bad request; the model itself is healthy
+                        breaker.record_result(True, latency)
+                        recorded = True
+                        break  # Try next model immediately
+
+                    breaker.record_result(False, latency)
+                    recorded = True
+                    if kind == RATE_LIMITED:
+                        # Let other sessions queue instead of hitting the same 429
+                        limiter.drain(current_model_name)
+                        delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+                    else:
+                        delay = base_delay
+
+                    # Retry this model only if the backoff and another attempt fit in its share
+                    spent_on_model = time.monotonic() - model_started
+                    if (attempt < max_retries
+                            and spent_on_model + delay < model_share
+                            and deadline.remaining() - delay >= GEMINI_MIN_ATTEMPT_TIME):
+                        await asyncio.sleep(min(delay, deadline.remaining()))
+                        continue
+                    break  # Try next model
+            finally:
+                if not recorded:
+                    breaker.release()
+
+    if deadline.expired():
+        message = f"Generation did not finish within its {deadline.seconds:g}s deadline."
+        if last_error is not None and str(last_error):
+            message += f" Last error: {last_error}"
+        raise DeadlineExceededError(message, last_error)
+    if last_error is None:
+        raise GenerationError("All models are temporarily unavailable (circuits open)")
+    raise GenerationError(f"All models failed. Last error: {last_error}", last_error)
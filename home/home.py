@@ -2,14 +2,7 @@
 Home page module for MedInsight AI - RadiologyAI Pro
 """
 import streamlit as st
-import google.generativeai as genai
-import PyPDF2
-from gemini_api import GEMINI_API_KEY
-from utils import generate_text_report_with_retry
-
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash-lite')
+from utils import generate_text_report_with_retry, extract_text_from_pdf
 
 # Comprehensive Hospital Database for Gulbarga
 HOSPITALS_DATA = {
@@ -258,18 +251,6 @@ HOSPITALS_DATA = {
     }
 }
 
-def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF report"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
-    except Exception as e:
-        st.error(f"Error reading PDF: {str(e)}")
-        return None
-
 def analyze_medical_report(report_text):
     """Analyze medical report and extract key information"""
     prompt = f"""Analyze this medical imaging report and extract key information:
@@ -2,23 +2,12 @@
 Hospital Recommendation System for Gulbarga
 """
 import streamlit as st
-import google.generativeai as genai
-import PyPDF2
-import tempfile
 from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.enums import TA_CENTER
-from reportlab.lib.colors import HexColor
+from reportlab.platypus import Paragraph, Spacer
 import random
-from gemini_api import GEMINI_API_KEY
-from utils import generate_text_report_with_retry
-
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash-lite')
+from utils import generate_text_report_with_retry, extract_text_from_pdf
+from pdf_engine import get_pdf_styles, render_pdf
 
 # Comprehensive Hospital Database for Gulbarga
 HOSPITALS_DATA = {
@@ -333,18 +322,6 @@ TREATMENT_COSTS = {
     }
 }
 
-def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF report"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
-    except Exception as e:
-        st.error(f"Error reading PDF: {str(e)}")
-        return None
-
 def analyze_medical_report(report_text):
     """Analyze medical report and extract key information"""
     prompt = f"""Analyze this medical imaging report and extract key information:
@@ -432,60 +409,37 @@ Rank by: 1) Condition relevance, 2) Budget appropriateness, 3) Success rate, 4)
         return None
 
 def create_recommendation_pdf(report_analysis, recommendations, patient_info):
-    """Create comprehensive PDF with analysis and recommendations"""
+    """Create comprehensive PDF with analysis and recommendations, rendered entirely in memory"""
     try:
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        doc = SimpleDocTemplate(temp_file.name, pagesize=A4)
         story = []
-        styles = getSampleStyleSheet()
-        
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=HexColor('#1e3a8a'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=16,
-            textColor=HexColor('#667eea'),
-            spaceAfter=12,
-            spaceBefore=12
-        )
+        styles = get_pdf_styles()
         
         # Title
-        story.append(Paragraph("🏥 HOSPITAL RECOMMENDATION REPORT", title_style))
-        story.append(Paragraph("Based on AI Medical Report Analysis", styles['Normal']))
+        story.append(Paragraph("🏥 HOSPITAL RECOMMENDATION REPORT", styles['title']))
+        story.append(Paragraph("Based on AI Medical Report Analysis", styles['normal']))
         story.append(Spacer(1, 0.3*inch))
         
         # Patient Info
-        story.append(Paragraph("PATIENT INFORMATION", heading_style))
+        story.append(Paragraph("PATIENT INFORMATION", styles['heading']))
         for key, value in patient_info.items():
-            story.append(Paragraph(f"<b>{key}:</b> {value}", styles['Normal']))
+            story.append(Paragraph(f"<b>{key}:</b> {value}", styles['normal']))
         story.append(Spacer(1, 0.2*inch))
         
         # Report Analysis
-        story.append(Paragraph("MEDICAL REPORT ANALYSIS", heading_style))
+        story.append(Paragraph("MEDICAL REPORT ANALYSIS", styles['heading']))
         for line in report_analysis.split('\n'):
             if line.strip():
-                story.append(Paragraph(line, styles['Normal']))
+                story.append(Paragraph(line, styles['normal']))
         story.append(Spacer(1, 0.3*inch))
         
         # Recommendations
-        story.append(Paragraph("RECOMMENDED HOSPITALS", heading_style))
+        story.append(Paragraph("RECOMMENDED HOSPITALS", styles['heading']))
         for line in recommendations.split('\n'):
             if line.strip():
-                story.append(Paragraph(line, styles['Normal']))
+                story.append(Paragraph(line, styles['normal']))
                 story.append(Spacer(1, 0.05*inch))
         
-        doc.build(story)
-        
-        with open(temp_file.name, 'rb') as f:
-            return f.read()
+        return render_pdf(story)
     except Exception as e:
         st.error(f"Error creating PDF: {str(e)}")
         return None
@@ -0,0 +1,480 @@
+"""
+Image pipeline for MedInsight AI - RadiologyAI Pro
+
+Prepares uploaded images for the Gemini API: downscales to a per-modality
+target resolution, stores obviously grayscale images as single-channel "L",
+and picks the smallest of PNG, JPEG and WebP that stays within a quality
+bound. The result is encoded once per request and reused by every retry.
+Several images can also be tiled into one labelled montage so a multi-image
+study costs a single request.
+
+Uploads are decoded straight to the largest size any step needs: JPEGs through
+the decoder's DCT scaling (draft mode), other formats with an integer box
+reduction, under a pixel ceiling. Pages display a separate small thumbnail.
+Uniform borders, padding and detached strips of UI chrome are trimmed from
+row and column intensity profiles, and the crop box is kept for the PDF.
+High-bit-depth (16-bit or float) images are windowed to 8 bits from a
+percentile or preset window, keeping the original array for re-windowing.
+"""
+import io
+import os
+from collections import namedtuple
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, features
+
+# Longest side sent to the model per modality; the model downsamples larger images anyway
+MODALITY_MAX_SIDE = {
+    'xray': 2048,
+    'ct': 1536,
+    'mri': 1536,
+    'ultrasound': 1280,
+    'classification': 768,
+}
+DEFAULT_MAX_SIDE = 1536
+
+# Longest side an upload is decoded to, and the largest declared size accepted at all
+DECODE_MAX_SIDE = int(os.getenv('DECODE_MAX_SIDE', max(MODALITY_MAX_SIDE.values())))
+DECODE_MAX_PIXELS = int(os.getenv('DECODE_MAX_PIXELS', 100_000_000))
+# Longest side of the thumbnail rendered in the page
+DISPLAY_MAX_SIDE = int(os.getenv('DISPLAY_MAX_SIDE', 800))
+
+# Border trimming: rows/columns whose intensity spread is at most ROI_UNIFORM_STD are uniform
+ROI_CROP = os.getenv('ROI_CROP', '1') != '0'
+ROI_UNIFORM_STD = float(os.getenv('ROI_UNIFORM_STD', 3.0))
+# Uniform gaps up to this fraction of a side are bridged. Detached content at the edges is
+# kept (laterality markers, calipers, depth scales) unless it looks like UI chrome: a strip
+# thinner than ROI_MIN_RUN of a side whose content spans at least ROI_CHROME_SPAN across it
+ROI_MAX_GAP = 0.02
+ROI_MIN_RUN = 0.1
+ROI_CHROME_SPAN = 0.8
+# Margin kept around the content, and the smallest crop (area fraction) trusted
+ROI_MARGIN = 0.01
+ROI_MIN_AREA = 0.25
+# Side of the grayscale copy the profiles are computed on
+ROI_ANALYSIS_SIDE = 1024
+
+# Modes holding more than 8 bits per pixel (16-bit PNG/TIFF exports, 32-bit int and float)
+HIGH_BIT_DEPTH_MODES = ('I;16', 'I;16L', 'I;16B', 'I;16N', 'I', 'F')
+# Percentiles of the pixel values mapped to black and white when no window is given
+WINDOW_PERCENTILES = {
+    'xray': (0.5, 99.5),
+    'ct': (0.5, 99.5),
+    'mri': (0.5, 99.8),
+    'ultrasound': (0.0, 100.0),
+}
+DEFAULT_WINDOW_PERCENTILES = (0.5, 99.5)
+# Named (center, width) windows; CT presets are in HU, stored as HU + CT_HU_OFFSET in 16-bit exports
+CT_HU_OFFSET = int(os.getenv('CT_HU_OFFSET', 1024))
+WINDOW_PRESETS = {
+    'ct': {
+        'brain': (40, 80),
+        'soft_tissue': (40, 400),
+        'lung': (-600, 1500),
+        'bone': (400, 1800),
+    },
+}
+
+# Lossy encodings are only used if they keep at least this PSNR (dB) against the resized image
+UPLOAD_MIN_PSNR = float(os.getenv('UPLOAD_MIN_PSNR', 42))
+UPLOAD_LOSSY_QUALITY = int(os.getenv('UPLOAD_LOSSY_QUALITY', 90))
+
+# Largest per-pixel channel difference still treated as grayscale
+GRAYSCALE_TOLERANCE = 3
+
+# Elements per chunk when summing squared errors
+PSNR_CHUNK = 1 << 20
+
+# Gap between montage tiles in pixels
+MONTAGE_GAP = 4
+
+EncodedImage = namedtuple('EncodedImage', ['data', 'mime_type', 'size', 'mode'])
+MontageTile = namedtuple('MontageTile', ['number', 'label', 'source', 'box'])
+Montage = namedtuple('Montage', ['image', 'tiles'])
+
+
+def is_grayscale(image, tolerance=GRAYSCALE_TOLERANCE):
+    """Return True if an RGB image carries (almost) no colour information"""
+    if image.mode in ('L', 'LA', 'I', 'I;16', 'F', '1'):
+        return True
+    # Check a ~256px box-filtered sample instead of every pixel
+    factor = max(1, max(image.size) // 256)
+    sample = image.reduce(factor) if factor > 1 else image
+    pixels = np.asarray(sample.convert('RGB'), dtype=np.int16)
+    spread = pixels.max(axis=2) - pixels.min(axis=2)
+    return int(spread.max()) <= tolerance
+
+
+def normalize_mode(image):
+    """Convert an image to 'L' if it is grayscale, otherwise to 'RGB'"""
+    if image.mode in HIGH_BIT_DEPTH_MODES:
+        # A plain convert('L') would clip everything above 255
+        return normalize_bit_depth(image)
+    if image.mode in ('RGBA', 'LA', 'P') or 'transparency' in image.info:
+        # Flatten transparency onto black, the usual background of medical images
+        rgba = image.convert('RGBA')
+        background = Image.new('RGBA', rgba.size, (0, 0, 0, 255))
+        image = Image.alpha_composite(background, rgba)
+    if is_grayscale(image):
+        return image if image.mode == 'L' else image.convert('L')
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def resize_for_modality(image, modality=None):
+    """Downscale so the longest side does not exceed the modality's target"""
+    max_side = MODALITY_MAX_SIDE.get(modality, DEFAULT_MAX_SIDE)
+    width, height = image.size
+    scale = max_side / float(max(width, height))
+    if scale >= 1:
+        return image
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return image.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def reduce_to_side(image, max_side=DECODE_MAX_SIDE):
+    """Decode (if still lazy) and shrink an image so its longest side is at most max_side
+
+    A JPEG that has not been loaded yet is decoded at 1/2, 1/4 or 1/8 scale by
+    the DCT decoder, so the full-resolution bitmap never exists. The rest is
+    done with a cheap integer reduce and a final LANCZOS step. The original size
+    is kept in image.info['original_size'].
+    """
+    original_size = image.info.get('original_size', image.size)
+    width, height = image.size
+    if not max_side or max(width, height) <= max_side:
+        image.load()
+        image.info['original_size'] = original_size
+        return image
+
+    scale = max_side / float(max(width, height))
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if image.mode in HIGH_BIT_DEPTH_MODES and image.mode != 'F':
+        # reduce() has no 16-bit modes; 32-bit integers keep the full range
+        image = image.convert('I')
+    if image.format == 'JPEG' and image.tile:
+        # draft() keeps the decoded size at or above the requested one
+        image.draft(image.mode, target)
+    image.load()
+
+    factor = max(image.size) // max_side
+    if factor > 1:
+        image = image.reduce(factor)
+    if max(image.size) > max_side:
+        image = image.resize(target, Image.Resampling.LANCZOS)
+    image.info['original_size'] = original_size
+    return image
+
+
+def decode_image(src, max_side=DECODE_MAX_SIDE, max_pixels=DECODE_MAX_PIXELS):
+    """Open an image file and decode it no larger than max_side
+
+    The declared size is checked against max_pixels before any pixel data is
+    decoded; larger images raise ValueError.
+    """
+    image = Image.open(src)
+    width, height = image.size
+    if max_pixels and width * height > max_pixels:
+        image.close()
+        raise ValueError(f"Image is {width} x {height} px, above the limit of {max_pixels:,} pixels")
+    return reduce_to_side(image, max_side)
+
+
+def _extent(content):
+    """Fraction of a boolean profile between its first and last True entry"""
+    indices = np.flatnonzero(content)
+    return (indices[-1] - indices[0] + 1) / float(len(content)) if indices.size else 0.0
+
+
+def _content_span(uniform, band_extent):
+    """(start, stop) from the first to the last content run of a boolean uniformity profile
+
+    Only uniform borders are trimmed. A detached run at either end is dropped
+    as well when it is a thin band whose content stretches across the image
+    (band_extent(start, stop) >= ROI_CHROME_SPAN), as burned-in toolbars and
+    header strips do; small isolated content such as markers is kept.
+    """
+    length = len(uniform)
+    content = np.flatnonzero(~uniform)
+    if not content.size:
+        return None
+    breaks = np.flatnonzero(np.diff(content) > ROI_MAX_GAP * length + 1)
+    runs = list(zip(np.r_[content[0], content[breaks + 1]], np.r_[content[breaks], content[-1]] + 1))
+
+    def chrome(run):
+        start, stop = run
+        return stop - start < ROI_MIN_RUN * length and band_extent(start, stop) >= ROI_CHROME_SPAN
+
+    while len(runs) > 1 and chrome(runs[0]):
+        runs.pop(0)
+    while len(runs) > 1 and chrome(runs[-1]):
+        runs.pop()
+    return int(runs[0][0]), int(runs[-1][1])
+
+
+def find_content_box(image):
+    """Return the (left, top, right, bottom) box of the anatomical content, or None to keep the whole image
+
+    Rows and columns with (almost) no intensity variation are borders or
+    padding. The box spans all remaining content, including detached markers
+    and annotations; only thin strips running across the image at its edges,
+    such as burned-in toolbars, are left out.
+    """
+    gray = image if image.mode == 'L' else image.convert('L')
+    factor = max(1, max(gray.size) // ROI_ANALYSIS_SIDE)
+    pixels = np.asarray(gray.reduce(factor) if factor > 1 else gray, dtype=np.float32)
+    if min(pixels.shape) < 8:
+        return None
+
+    rows = _content_span(pixels.std(axis=1) <= ROI_UNIFORM_STD,
+                         lambda start, stop: _extent(pixels[start:stop].std(axis=0) > ROI_UNIFORM_STD))
+    if rows is None:
+        return None
+    band = pixels[rows[0]:rows[1]]
+    columns = _content_span(band.std(axis=0) <= ROI_UNIFORM_STD,
+                            lambda start, stop: _extent(band[:, start:stop].std(axis=1) > ROI_UNIFORM_STD))
+    if columns is None:
+        return None
+
+    height, width = pixels.shape
+    margin_y, margin_x = int(np.ceil(ROI_MARGIN * height)), int(np.ceil(ROI_MARGIN * width))
+    top, bottom = max(0, rows[0] - margin_y), min(height, rows[1] + margin_y)
+    left, right = max(0, columns[0] - margin_x), min(width, columns[1] + margin_x)
+    if (bottom - top) * (right - left) < ROI_MIN_AREA * height * width:
+        # Too aggressive to trust; keep the whole image
+        return None
+    if (top, left, bottom, right) == (0, 0, height, width):
+        return None
+
+    scale_x, scale_y = image.size[0] / float(width), image.size[1] / float(height)
+    return (int(left * scale_x), int(top * scale_y),
+            min(image.size[0], int(np.ceil(right * scale_x))), min(image.size[1], int(np.ceil(bottom * scale_y))))
+
+
+def crop_to_content(image):
+    """Trim uniform borders and padding; the box in original-image pixels is kept in info['crop_box']"""
+    box = find_content_box(image) if ROI_CROP else None
+    if box is None:
+        return image
+    info = dict(image.info)
+    original_size = info.get('original_size', image.size)
+    scale_x, scale_y = original_size[0] / float(image.size[0]), original_size[1] / float(image.size[1])
+    cropped = image.crop(box)
+    if info.get('raw_pixels') is not None:
+        info['raw_pixels'] = info['raw_pixels'][box[1]:box[3], box[0]:box[2]]
+    cropped.info.update(info)
+    cropped.info['crop_box'] = (round(box[0] * scale_x), round(box[1] * scale_y),
+                                round(box[2] * scale_x), round(box[3] * scale_y))
+    return cropped
+
+
+def make_thumbnail(image, max_side=DISPLAY_MAX_SIDE):
+    """Return a small copy of an image for display; the analysis image is left untouched"""
+    thumbnail = image.copy()
+    thumbnail.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return thumbnail
+
+
+def window_to_uint8(pixels, center, width):
+    """Map pixel values to 0-255 through a linear window (DICOM PS3.3 C.11.2.1.2)
+
+    Values at or below the bottom of the window become 0 and values above the top
+    become 255. Works on whole arrays at once, in place on a float32 copy.
+    """
+    width = max(float(width), 1.0)
+    low = float(center) - 0.5 - (width - 1) / 2
+    out = np.array(pixels, dtype=np.float32)
+    out -= low
+    out *= 255.0 / max(width - 1, 1.0)
+    np.clip(out, 0, 255, out=out)
+    return out.astype(np.uint8)
+
+
+def percentile_window(pixels, low_percentile, high_percentile):
+    """Return the (center, width) window spanning two percentiles of the pixel values
+
+    Integer data is histogrammed with a single bincount pass instead of sorting.
+    """
+    if pixels.dtype.kind in 'ui':
+        base = int(pixels.min())
+        span = int(pixels.max()) - base
+        if span < (1 << 22):
+            counts = np.bincount((pixels if base == 0 and pixels.dtype.kind == 'u'
+                                  else pixels.astype(np.int64) - base).ravel(), minlength=span + 1)
+            cumulative = np.cumsum(counts)
+            total = cumulative[-1]
+            low = base + int(np.searchsorted(cumulative, total * low_percentile / 100.0, side='left'))
+            high = base + int(np.searchsorted(cumulative, total * high_percentile / 100.0, side='left'))
+        else:
+            low, high = (float(v) for v in np.percentile(pixels, (low_percentile, high_percentile)))
+    else:
+        low, high = (float(v) for v in np.nanpercentile(pixels, (low_percentile, high_percentile)))
+    width = max(high - low, 1) + 1
+    return low + 0.5 + (width - 1) / 2.0, width
+
+
+def apply_window(pixels, center, width):
+    """Window an array to uint8; integer data goes through a lookup table in one gather"""
+    if pixels.dtype.kind in 'ui':
+        base = int(pixels.min())
+        span = int(pixels.max()) - base
+        if span < (1 << 22):
+            lut = window_to_uint8(np.arange(base, base + span + 1, dtype=np.float32), center, width)
+            return lut[pixels] if base == 0 and pixels.dtype.kind == 'u' else lut[pixels.astype(np.int64) - base]
+    return window_to_uint8(pixels, center, width)
+
+
+def normalize_bit_depth(image, modality=None, window=None):
+    """Map a 16-bit, 32-bit or float image to 8-bit 'L'; other images are returned unchanged
+
+    Without a window, the modality's percentile window is used. The original
+    array and the window are kept in image.info['raw_pixels'] and
+    image.info['window'] so the image can be re-windowed without decoding again.
+    """
+    if image.mode not in HIGH_BIT_DEPTH_MODES:
+        return image
+    pixels = np.asarray(image)
+    if pixels.dtype.kind == 'i' and pixels.size and pixels.min() >= 0 and pixels.max() < 65536:
+        # Half the memory for the kept copy; 16-bit exports rarely need more
+        pixels = pixels.astype(np.uint16)
+    if window is None:
+        window = percentile_window(pixels, *WINDOW_PERCENTILES.get(modality, DEFAULT_WINDOW_PERCENTILES))
+    result = Image.fromarray(apply_window(pixels, *window), 'L')
+    result.info.update(image.info)
+    result.info['raw_pixels'] = pixels
+    result.info['window'] = (float(window[0]), float(window[1]))
+    return result
+
+
+def rewindow(image, center=None, width=None, preset=None, modality=None):
+    """Window a normalised high-bit-depth image again from its kept original array
+
+    Give either center and width (in stored pixel values) or a preset name from
+    WINDOW_PRESETS for the modality. Images without raw pixels are returned unchanged.
+    """
+    pixels = image.info.get('raw_pixels')
+    if pixels is None:
+        return image
+    if preset is not None:
+        center, width = WINDOW_PRESETS[modality][preset]
+        if modality == 'ct':
+            center += CT_HU_OFFSET
+    result = Image.fromarray(apply_window(pixels, center, width), 'L')
+    result.info.update(image.info)
+    result.info['window'] = (float(center), float(width))
+    # Digests and hashes cached for the old pixels no longer match
+    for key in ('pixel_digest', 'perceptual_hashes'):
+        result.info.pop(key, None)
+    return result
+
+
+def psnr(reference, candidate):
+    """Peak signal-to-noise ratio in dB between two images of the same size and mode"""
+    # An int16 difference summed in chunks avoids full-size float temporaries
+    diff = np.subtract(np.asarray(reference), np.asarray(candidate), dtype=np.int16).ravel()
+    total = 0
+    for start in range(0, diff.size, PSNR_CHUNK):
+        chunk = diff[start:start + PSNR_CHUNK].astype(np.int64)
+        total += int(np.dot(chunk, chunk))
+    mse = total / max(diff.size, 1)
+    if mse == 0:
+        return float('inf')
+    return 10 * np.log10(255.0 ** 2 / mse)
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'PNG':
+        image.save(buffer, format='PNG', compress_level=6)
+    elif fmt == 'JPEG':
+        options = {'quality': UPLOAD_LOSSY_QUALITY}
+        if image.mode == 'RGB':
+            # Keep full chroma resolution; colour overlays carry fine detail
+            options['subsampling'] = 0
+        image.save(buffer, format='JPEG', **options)
+    else:
+        image.save(buffer, format='WEBP', quality=UPLOAD_LOSSY_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def prepare_for_upload(image, modality=None, min_psnr=UPLOAD_MIN_PSNR):
+    """Resize, normalise and encode an image for the model; returns an EncodedImage"""
+    prepared = resize_for_modality(normalize_mode(image), modality)
+
+    best_data, best_mime = _encode(prepared, 'PNG'), 'image/png'
+    lossy_formats = [('JPEG', 'image/jpeg')]
+    if features.check('webp'):
+        lossy_formats.append(('WEBP', 'image/webp'))
+
+    for fmt, mime_type in lossy_formats:
+        data = _encode(prepared, fmt)
+        if len(data) >= len(best_data):
+            continue
+        with Image.open(io.BytesIO(data)) as decoded:
+            decoded = decoded.convert(prepared.mode)
+            if psnr(prepared, decoded) >= min_psnr:
+                best_data, best_mime = data, mime_type
+
+    return EncodedImage(best_data, best_mime, prepared.size, prepared.mode)
+
+
+def _grid_shape(count, aspect=1.0):
+    """Columns and rows for count tiles, close to square for tiles of the given aspect ratio"""
+    columns = max(1, int(np.ceil(np.sqrt(count / aspect))))
+    columns = min(columns, count)
+    return columns, int(np.ceil(count / columns))
+
+
+def compose_montage(images, labels=None, sources=None, max_side=DEFAULT_MAX_SIDE, columns=None):
+    """Tile images into one labelled grid whose longest side is at most max_side
+
+    Tiles are numbered from 1 in reading order (left to right, top to bottom) and
+    each number is drawn in the tile's top-left corner, followed by its label.
+    Returns a Montage with the image and one MontageTile per input, mapping the
+    tile number back to its label, its source (defaults to the input position)
+    and its (left, top, right, bottom) box in the montage.
+    """
+    if not images:
+        raise ValueError("compose_montage needs at least one image")
+    labels = list(labels) if labels is not None else [''] * len(images)
+    sources = list(sources) if sources is not None else list(range(len(images)))
+
+    prepared = [normalize_mode(image) for image in images]
+    mode = 'L' if all(image.mode == 'L' for image in prepared) else 'RGB'
+    # Cells share the median aspect ratio of the inputs; each image is fitted inside its cell
+    aspect = float(np.median([image.size[0] / image.size[1] for image in prepared]))
+    if columns is None:
+        columns, rows = _grid_shape(len(prepared), aspect)
+    else:
+        rows = int(np.ceil(len(prepared) / columns))
+
+    cell_width = (max_side - MONTAGE_GAP * (columns - 1)) / columns
+    cell_height = cell_width / aspect
+    if rows * cell_height + MONTAGE_GAP * (rows - 1) > max_side:
+        cell_height = (max_side - MONTAGE_GAP * (rows - 1)) / rows
+        cell_width = cell_height * aspect
+    cell_width, cell_height = max(1, int(cell_width)), max(1, int(cell_height))
+
+    canvas = Image.new(mode, (columns * cell_width + MONTAGE_GAP * (columns - 1),
+                              rows * cell_height + MONTAGE_GAP * (rows - 1)), 0)
+    draw = ImageDraw.Draw(canvas)
+    font = ImageFont.load_default(size=max(10, cell_height // 14))
+    white = 255 if mode == 'L' else (255, 255, 255)
+
+    tiles = []
+    for position, image in enumerate(prepared):
+        row, column = divmod(position, columns)
+        left = column * (cell_width + MONTAGE_GAP)
+        top = row * (cell_height + MONTAGE_GAP)
+        fitted = image.copy()
+        fitted.thumbnail((cell_width, cell_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        offset = (left + (cell_width - fitted.size[0]) // 2, top + (cell_height - fitted.size[1]) // 2)
+        canvas.paste(fitted.convert(mode), offset)
+
+        number = position + 1
+        caption = f"{number} · {labels[position]}" if labels[position] else str(number)
+        text_box = draw.textbbox((left + 4, top + 4), caption, font=font)
+        draw.rectangle((text_box[0] - 3, text_box[1] - 3, text_box[2] + 3, text_box[3] + 3), fill=0)
+        draw.text((left + 4, top + 4), caption, fill=white, font=font)
+        tiles.append(MontageTile(number, labels[position], sources[position],
+                                 (offset[0], offset[1], offset[0] + fitted.size[0], offset[1] + fitted.size[1])))
+
+    return Montage(canvas, tiles)
@@ -0,0 +1,223 @@
+"""
+Inference backends for MedInsight AI - RadiologyAI Pro
+
+The Gemini client talks to models through a backend. GeminiBackend wraps
+google.generativeai; StubBackend is an offline stand-in with configurable
+latency, 429/500 error rates and canned responses, for load testing and
+benchmarking without network access or API quota.
+
+The backend is chosen with INFERENCE_BACKEND=gemini|stub.
+"""
+import asyncio
+import os
+import random
+import threading
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from gemini_api import GEMINI_API_KEY
+
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'gemini')
+
+# Stub backend configuration (overridable from the environment)
+STUB_LATENCY_MEDIAN = float(os.getenv('STUB_LATENCY_MEDIAN', 1.5))
+STUB_LATENCY_SIGMA = float(os.getenv('STUB_LATENCY_SIGMA', 0.5))
+STUB_RATE_429 = float(os.getenv('STUB_RATE_429', 0.0))
+STUB_RATE_500 = float(os.getenv('STUB_RATE_500', 0.0))
+# Simulated upload bandwidth in bytes per second (0 disables the transfer delay)
+STUB_UPLOAD_BANDWIDTH = float(os.getenv('STUB_UPLOAD_BANDWIDTH', 0))
+STUB_RESPONSE_FILE = os.getenv('STUB_RESPONSE_FILE', '')
+STUB_SEED = os.getenv('STUB_SEED')
+
+STUB_RESPONSE = """**Image Quality**: Adequate for interpretation (stub response).
+
+**Findings**: No acute abnormality identified in this simulated analysis.
+
+**Impression**: Normal study.
+
+**Recommendations**: None. This is a canned response from the offline stub backend."""
+
+
+class InferenceBackend:
+    """Interface for model backends used by the Gemini client
+
+    get_model() returns a handle with an async generate_content_async(contents,
+    stream=False) method that behaves like google.generativeai.GenerativeModel:
+    the result has a .text attribute, or is an async iterable of chunks with
+    .text when stream=True.
+    """
+
+    name = 'base'
+
+    def get_model(self, model_name):
+        raise NotImplementedError
+
+    def warm_up(self, model_names):
+        """Create handles for the given models ahead of the first request"""
+        for model_name in model_names:
+            try:
+                self.get_model(model_name)
+            except Exception:
+                pass
+
+
+class GeminiBackend(InferenceBackend):
+    """Google Gemini through google.generativeai, one shared handle per model"""
+
+    name = 'gemini'
+
+    def __init__(self, api_key=GEMINI_API_KEY):
+        self.api_key = api_key
+        self._models = {}
+        self._lock = threading.Lock()
+        self._configured = False
+
+    def configure(self):
+        """Configure the Gemini SDK with the API key, once per process"""
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    genai.configure(api_key=self.api_key)
+                    self._configured = True
+
+    def get_model(self, model_name):
+        """Return the shared GenerativeModel handle for a model, creating it on first use"""
+        model = self._models.get(model_name)
+        if model is None:
+            self.configure()
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = self._models[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+
+def payload_bytes(contents):
+    """Return the number of inline data bytes in a generate_content payload"""
+    if isinstance(contents, (str, dict)):
+        contents = [contents]
+    return sum(len(part.get('data', b'')) for part in contents if isinstance(part, dict))
+
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _StubStream:
+    def __init__(self, model, chunks, delay):
+        self._model = model
+        self._chunks = chunks
+        self._delay = delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield _StubResponse(chunk)
+
+
+class _StubModel:
+    def __init__(self, backend, model_name):
+        self._backend = backend
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        return await self._backend.generate(self.model_name, contents, stream)
+
+
+class StubBackend(InferenceBackend):
+    """Offline backend with log-normal latency, injected errors and canned responses
+
+    latency_median and latency_sigma describe a log-normal latency in seconds;
+    rate_429 and rate_500 are the probabilities of raising ResourceExhausted and
+    InternalServerError; upload_bandwidth (bytes per second) adds the time it
+    would take to send the request's image parts. Any of them may be overridden per model through
+    model_overrides, e.g. {'gemini-2.0-flash-lite': {'rate_429': 0.5}}.
+    """
+
+    name = 'stub'
+
+    def __init__(self, latency_median=STUB_LATENCY_MEDIAN, latency_sigma=STUB_LATENCY_SIGMA,
+                 rate_429=STUB_RATE_429, rate_500=STUB_RATE_500, response=None,
+                 model_overrides=None, seed=STUB_SEED, upload_bandwidth=STUB_UPLOAD_BANDWIDTH):
+        if response is None and STUB_RESPONSE_FILE:
+            with open(STUB_RESPONSE_FILE, encoding='utf-8') as f:
+                response = f.read()
+        self.defaults = {
+            'latency_median': latency_median,
+            'latency_sigma': latency_sigma,
+            'rate_429': rate_429,
+            'rate_500': rate_500,
+            'response': response or STUB_RESPONSE,
+            'upload_bandwidth': upload_bandwidth,
+        }
+        self.model_overrides = model_overrides or {}
+        self._random = random.Random(None if seed is None else int(seed))
+        self.calls = {}
+        self.errors = {}
+
+    def _config(self, model_name):
+        config = dict(self.defaults)
+        config.update(self.model_overrides.get(model_name, {}))
+        return config
+
+    def _count(self, counter, model_name):
+        counter[model_name] = counter.get(model_name, 0) + 1
+
+    def get_model(self, model_name):
+        return _StubModel(self, model_name)
+
+    async def generate(self, model_name, contents, stream=False):
+        config = self._config(model_name)
+        self._count(self.calls, model_name)
+        latency = self._random.lognormvariate(0, config['latency_sigma']) * config['latency_median']
+        if config['upload_bandwidth']:
+            latency += payload_bytes(contents) / config['upload_bandwidth']
+        roll = self._random.random()
+
+        if roll < config['rate_429']:
+            await asyncio.sleep(latency * 0.1)
+            self._count(self.errors, model_name)
+            raise api_exceptions.ResourceExhausted("429 Resource has been exhausted (stub)")
+        if roll < config['rate_429'] + config['rate_500']:
+            await asyncio.sleep(latency * 0.5)
+            self._count(self.errors, model_name)
+            raise api_exceptions.InternalServerError("500 Internal error encountered (stub)")
+
+        text = config['response']
+        if not stream:
+            await asyncio.sleep(latency)
+            return _StubResponse(text)
+
+        # Spend ~30% of the latency before the first chunk, then stream the rest
+        words = text.split(' ')
+        chunks = [' '.join(words[i:i + 8]) + (' ' if i + 8 < len(words) else '') for i in range(0, len(words), 8)]
+        await asyncio.sleep(latency * 0.3)
+        return _StubStream(self, chunks, latency * 0.7 / max(1, len(chunks)))
+
+    def stats(self):
+        """Return per-model call and error counts"""
+        return {'calls': dict(self.calls), 'errors': dict(self.errors)}
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide inference backend selected by INFERENCE_BACKEND"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = StubBackend() if INFERENCE_BACKEND == 'stub' else GeminiBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the process-wide inference backend (used by benchmarks and load tests)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,215 @@
+"""
+Key-slice selection for MedInsight AI - RadiologyAI Pro
+
+A CT or MRI study arrives as a series of hundreds of slices, far too many to
+send to the model. Slices are streamed one at a time from a zip archive or a
+multi-file upload, scored with cheap vectorised metrics (entropy, edge density
+and intensity variance) on a small copy, and only the K most informative ones
+are decoded again and kept. Memory stays bounded by K, and the selection is
+deterministic for a given series.
+"""
+import io
+import os
+import re
+import zipfile
+from collections import namedtuple
+import numpy as np
+from PIL import Image
+from dicom_io import is_dicom, iter_dicom_frames, read_dicom_header, slice_position
+from image_pipeline import HIGH_BIT_DEPTH_MODES, normalize_bit_depth, reduce_to_side
+
+# Upper bound on slices scored per series
+SERIES_MAX_SLICES = int(os.getenv('SERIES_MAX_SLICES', 2000))
+# Side of the downsampled copy the metrics are computed on
+SCORING_SIZE = 256
+# Gradient magnitude (0-255 scale) above which a pixel counts as an edge
+EDGE_THRESHOLD = 20
+# Relative weights of the normalised metrics in the final score
+METRIC_WEIGHTS = {'entropy': 0.4, 'edge_density': 0.4, 'variance': 0.2}
+
+SliceScore = namedtuple('SliceScore', ['index', 'name', 'entropy', 'edge_density', 'variance', 'score'])
+KeySliceSelection = namedtuple('KeySliceSelection', ['images', 'slices', 'total'])
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.dcm', '.dicom')
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+class SeriesSource:
+    """Re-iterable stream of (name, PIL image) slices from uploads or a zip archive
+
+    Each iteration re-opens the inputs, so only one decoded slice is alive at a
+    time. DICOM slices are put in anatomical order (position along the slice
+    normal, else InstanceNumber) from a header-only pass; other files follow
+    the natural sort of their names. Every frame of a multi-frame DICOM file is
+    a slice.
+    """
+
+    def __init__(self, uploads):
+        self.uploads = list(uploads) if isinstance(uploads, (list, tuple)) else [uploads]
+        self._order = None
+
+    def _listing(self):
+        """Yield (upload index, zip member name or None, name, handle) in upload order"""
+        for upload_index, upload in enumerate(self.uploads):
+            upload.seek(0)
+            if zipfile.is_zipfile(upload):
+                upload.seek(0)
+                with zipfile.ZipFile(upload) as archive:
+                    for name in archive.namelist():
+                        if (name.endswith('/') or name.startswith('__MACOSX/')
+                                or not name.lower().endswith(IMAGE_EXTENSIONS)):
+                            continue
+                        with archive.open(name) as member:
+                            yield upload_index, name, name, member
+            else:
+                upload.seek(0)
+                yield upload_index, None, getattr(upload, 'name', 'slice'), upload
+
+    def _sort_key(self, name, handle):
+        position = None
+        if is_dicom(handle):
+            try:
+                position = slice_position(read_dicom_header(handle))
+            except Exception:
+                position = None
+        if position is None:
+            return (1, 0.0, _natural_key(name))
+        return (0, position, _natural_key(name))
+
+    def order(self):
+        """(upload index, zip member name or None) of every file in series order, computed once"""
+        if self._order is None:
+            keyed = [(self._sort_key(name, handle), upload_index, member)
+                     for upload_index, member, name, handle in self._listing()]
+            self._order = [(upload_index, member) for _, upload_index, member in sorted(keyed, key=lambda k: k[0])]
+        return self._order
+
+    def _members(self):
+        archives = {}
+        try:
+            for upload_index, member in self.order():
+                upload = self.uploads[upload_index]
+                if member is None:
+                    upload.seek(0)
+                    yield getattr(upload, 'name', 'slice'), upload
+                    continue
+                if upload_index not in archives:
+                    upload.seek(0)
+                    archives[upload_index] = zipfile.ZipFile(upload)
+                with archives[upload_index].open(member) as handle:
+                    data = io.BytesIO(handle.read())
+                data.name = member
+                yield member, data
+        finally:
+            for archive in archives.values():
+                archive.close()
+
+    def __iter__(self):
+        count = 0
+        for name, handle in self._members():
+            if is_dicom(handle):
+                frames = iter_dicom_frames(handle)
+            else:
+                frames = [Image.open(handle)]
+            for frame_index, image in enumerate(frames):
+                if count >= SERIES_MAX_SLICES:
+                    return
+                if image.mode in HIGH_BIT_DEPTH_MODES:
+                    # 16-bit slices would clip in convert('L'); window them (no re-windowing kept)
+                    image = normalize_bit_depth(reduce_to_side(image))
+                    image.info.pop('raw_pixels', None)
+                label = f"{name}#{frame_index + 1}" if image.info.get('dicom_frames', 1) > 1 else name
+                yield label, image
+                count += 1
+
+
+def slice_metrics(image):
+    """Return (entropy, edge density, intensity variance) of a slice on a small grayscale copy"""
+    if image.format == 'JPEG' and image.tile:
+        # Let the JPEG decoder scale down instead of decoding the full slice
+        image.draft('L', (SCORING_SIZE, SCORING_SIZE))
+    small = image.convert('L')
+    factor = max(1, max(small.size) // SCORING_SIZE)
+    if factor > 1:
+        small = small.reduce(factor)
+    pixels = np.asarray(small, dtype=np.float32)
+
+    histogram = np.bincount(pixels.astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    probabilities = histogram[histogram > 0] / histogram.sum()
+    entropy = float(-(probabilities * np.log2(probabilities)).sum())
+
+    gx = np.abs(np.diff(pixels, axis=1))[:-1, :]
+    gy = np.abs(np.diff(pixels, axis=0))[:, :-1]
+    edge_density = float(np.mean((gx + gy) > EDGE_THRESHOLD)) if gx.size else 0.0
+
+    variance = float(pixels.var())
+    return entropy, edge_density, variance
+
+
+def score_series(source):
+    """Stream every slice once and return a SliceScore per slice, in series order"""
+    raw = []
+    for index, (name, image) in enumerate(source):
+        raw.append((index, name) + slice_metrics(image))
+        image.close()
+    if not raw:
+        return []
+
+    metrics = np.array([row[2:] for row in raw], dtype=np.float64)
+    spread = metrics.max(axis=0) - metrics.min(axis=0)
+    spread[spread == 0] = 1.0
+    normalised = (metrics - metrics.min(axis=0)) / spread
+    weights = np.array([METRIC_WEIGHTS['entropy'], METRIC_WEIGHTS['edge_density'], METRIC_WEIGHTS['variance']])
+    scores = normalised @ weights
+    return [SliceScore(*row, score=float(score)) for row, score in zip(raw, scores)]
+
+
+def pick_key_slices(scores, k, min_gap=None):
+    """Pick the k best-scoring slices, preferring slices at least min_gap apart
+
+    Ties are broken by slice index so the choice is reproducible. The result is
+    returned in series order.
+    """
+    if not scores:
+        return []
+    k = min(k, len(scores))
+    if min_gap is None:
+        # Neighbouring slices are near-duplicates; spread the picks through the volume
+        min_gap = max(1, len(scores) // (2 * k))
+    ranked = sorted(scores, key=lambda s: (-s.score, s.index))
+
+    chosen = []
+    for candidate in ranked:
+        if len(chosen) == k:
+            break
+        if all(abs(candidate.index - c.index) >= min_gap for c in chosen):
+            chosen.append(candidate)
+    for candidate in ranked:
+        if len(chosen) == k:
+            break
+        if candidate not in chosen:
+            chosen.append(candidate)
+    return sorted(chosen, key=lambda s: s.index)
+
+
+def select_key_slices(uploads, k=8):
+    """Score a series and return a KeySliceSelection with the k chosen slices decoded"""
+    source = SeriesSource(uploads)
+    scores = score_series(source)
+    chosen = pick_key_slices(scores, k)
+    wanted = {s.index: s for s in chosen}
+
+    # Second pass: decode only the chosen slices
+    images = {}
+    for index, (name, image) in enumerate(source):
+        if index in wanted:
+            images[index] = reduce_to_side(image)
+            if len(images) == len(wanted):
+                break
+        else:
+            image.close()
+
+    return KeySliceSelection([images[s.index] for s in chosen], chosen, len(scores))
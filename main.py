@@ -1,7 +1,17 @@
 """
 Main application entry point for MedInsight AI - RadiologyAI Pro
 """
+import os
+from pathlib import Path
 import streamlit as st
+from report_cache import get_report_cache
+from perceptual_hash import get_near_duplicate_index
+from modality_classifier import classifier_stats
+from pdf_engine import pdf_memo_stats, pdf_render_stats
+from report_archive import get_report_archive
+from bulk_export import EXPORT_DIR, day_range, export_reports
+from circuit_breaker import health_snapshot
+from gemini_client import hedge_stats, single_flight_stats, warm_up
 
 # Import all features
 from home.home import show_home_page, show_hospital_recommendation_page
@@ -19,6 +29,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Configure Gemini and pre-create the shared model handles (no-op after the first run)
+warm_up()
+
 # Enhanced Custom CSS
 st.markdown("""
     <style>
@@ -235,6 +248,58 @@ else:
         label_visibility="collapsed"
     )
 
+# Report cache statistics
+with st.sidebar.expander("📈 Report Cache"):
+    cache_stats = get_report_cache().stats()
+    st.metric("Gemini calls saved", cache_stats['calls_saved'])
+    st.caption(f"Hit rate: {cache_stats['hit_rate']:.0%} · Cached reports: {cache_stats['entries']}")
+    st.caption(f"Duplicate in-flight requests coalesced: {single_flight_stats()['coalesced']}")
+    st.caption(f"Near-duplicate images served from a stored report: {get_near_duplicate_index().stats()['reused']}")
+    classification_stats = classifier_stats()
+    st.caption(f"Classifications answered locally: {classification_stats['calls_avoided']}"
+               + (f" · agreement with Gemini: {classification_stats['agreement_rate']:.0%}"
+                  if classification_stats['agreement_rate'] is not None else ""))
+    pdf_stats = pdf_memo_stats()
+    st.caption(f"PDF reports rendered: {pdf_stats['renders']} · downloads served from memory: {pdf_stats['hits']}")
+    render_stats = pdf_render_stats()
+    if render_stats['pdfs']:
+        st.caption(f"PDF size: last {render_stats['last_bytes'] / 1024:.0f} KB · "
+                   f"mean {render_stats['mean_bytes'] / 1024:.0f} KB in {render_stats['mean_seconds'] * 1000:.0f} ms")
+
+# Bulk export of archived reports to a ZIP of PDFs
+with st.sidebar.expander("📦 Bulk Export"):
+    export_day = st.date_input("Reports archived on", key='export_day')
+    export_ids = get_report_archive().ids(*day_range(export_day))
+    st.caption(f"{len(export_ids)} archived reports on this day")
+    export_path = os.path.join(EXPORT_DIR, f"reports_{export_day.isoformat()}.zip")
+    if st.button("Export to ZIP", disabled=not export_ids, use_container_width=True):
+        export_progress = st.progress(0.0, text="Rendering PDFs...")
+        export_result = export_reports(
+            export_ids, export_path,
+            progress=lambda done, total: export_progress.progress(done / max(total, 1), text=f"{done}/{total} reports")
+        )
+        st.session_state['export_result'] = export_result
+    export_result = st.session_state.get('export_result')
+    if export_result and export_result.path == export_path and os.path.exists(export_path):
+        st.caption(f"{export_result.exported} exported · {export_result.skipped} already in the ZIP · "
+                   f"{len(export_result.failed)} failed · {export_result.seconds:.1f} s")
+        st.download_button("Download ZIP", data=Path(export_path).read_bytes, file_name=os.path.basename(export_path),
+                           mime="application/zip", use_container_width=True)
+
+# Model health scoreboard (circuit breaker state for this process)
+with st.sidebar.expander("🩺 Model Health"):
+    model_health = health_snapshot()
+    if model_health:
+        for health_model, health in model_health.items():
+            state_icon = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}[health['state']]
+            st.markdown(f"{state_icon} **{health_model}**")
+        st.json(model_health, expanded=False)
+    else:
+        st.caption("No Gemini requests yet.")
+    if hedge_stats()['enabled']:
+        st.caption("Hedged requests")
+        st.json(hedge_stats(), expanded=False)
+
 # Route to appropriate page
 if page == "🏠 Home":
     show_home_page()
@@ -0,0 +1,239 @@
+"""
+Local modality classifier for MedInsight AI - RadiologyAI Pro
+
+Decides between X-ray, CT, MRI and ultrasound from cheap vectorised features
+of a small grayscale copy: how much of the frame the anatomy fills, whether it
+sits in a circular field of view or a fan-shaped ultrasound sector, bone
+brightness, background noise, speckle and colour overlays. A DICOM Modality
+tag, when present, decides outright. The heuristic features are not yet
+calibrated on a real labelled corpus (they are confidently wrong on, e.g., a
+hand radiograph on black), so by default the image classification page only
+answers locally from the DICOM tag and asks Gemini otherwise.
+"""
+import os
+import re
+import threading
+from collections import namedtuple
+import numpy as np
+from dicom_io import DICOM_MODALITY_PAGES
+
+# Heuristic predictions at or above this confidence are answered locally, without a Gemini call;
+# above 1 (the default) only DICOM-tagged images are. Lower it only after calibrating with
+# benchmarks.bench_classifier on a real labelled corpus.
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv('CLASSIFIER_MIN_CONFIDENCE', 1.1))
+
+MODALITY_LABELS = {
+    'xray': "X-ray",
+    'ct': "CT Scan",
+    'mri': "MRI Scan",
+    'ultrasound': "Ultrasound",
+}
+
+# Side of the grayscale copy the features are computed on
+FEATURE_SIZE = 256
+# Pixels at or below this level count as background
+DARK_LEVEL = 12
+# Bone and contrast on CT saturate close to white
+BRIGHT_LEVEL = 235
+
+ModalityPrediction = namedtuple('ModalityPrediction', ['label', 'confidence', 'probabilities', 'features', 'source'])
+
+_stats = {'local': 0, 'remote': 0, 'remote_compared': 0, 'remote_agreed': 0}
+_stats_lock = threading.Lock()
+
+
+def _small_copies(image):
+    """Return (grayscale, rgb-or-None) arrays of a ~FEATURE_SIZE copy of the image"""
+    if image.format == 'JPEG' and image.tile:
+        image.draft(image.mode, (FEATURE_SIZE, FEATURE_SIZE))
+    factor = max(1, max(image.size) // FEATURE_SIZE)
+    small = image.reduce(factor) if factor > 1 else image
+    rgb = np.asarray(small.convert('RGB'), dtype=np.int16) if small.mode not in ('L', 'I', 'I;16', 'F') else None
+    return np.asarray(small.convert('L'), dtype=np.float32), rgb
+
+
+def _row_extent_mask(mask):
+    """Fill each row between its leftmost and rightmost foreground pixel"""
+    height, width = mask.shape
+    occupied = mask.any(axis=1)
+    left = np.argmax(mask, axis=1)
+    right = width - 1 - np.argmax(mask[:, ::-1], axis=1)
+    columns = np.arange(width)[None, :]
+    filled = (columns >= left[:, None]) & (columns <= right[:, None]) & occupied[:, None]
+    return filled, occupied, np.where(occupied, right - left + 1, 0)
+
+
+def _disc_iou(mask):
+    """Intersection over union of a mask with the disc of equal area at its centroid"""
+    area = mask.sum()
+    if area == 0:
+        return 0.0
+    rows, columns = np.nonzero(mask)
+    radius = np.sqrt(area / np.pi)
+    y, x = np.ogrid[:mask.shape[0], :mask.shape[1]]
+    disc = (y - rows.mean()) ** 2 + (x - columns.mean()) ** 2 <= radius ** 2
+    return float((mask & disc).sum() / max((mask | disc).sum(), 1))
+
+
+def _fan_score(widths, occupied):
+    """How much the foreground widens steadily from a narrow apex, as an ultrasound sector does"""
+    rows = np.nonzero(occupied)[0]
+    if len(rows) < 8:
+        return 0.0
+    # The sector widens over its upper part; the lower part is a curved arc
+    upper = rows[:max(4, int(len(rows) * 0.6))]
+    upper_widths = widths[upper].astype(np.float64)
+    if upper_widths.std() == 0:
+        return 0.0
+    correlation = float(np.corrcoef(upper, upper_widths)[0, 1])
+    apex_ratio = float(upper_widths[:max(1, len(upper) // 10)].mean() / max(widths.max(), 1))
+    return float(np.clip((correlation - 0.6) / 0.35, 0, 1) * np.clip(1 - apex_ratio / 0.6, 0, 1))
+
+
+def extract_features(image):
+    """Return a dict of modality features in [0, 1] (aspect is the width / height ratio)"""
+    gray, rgb = _small_copies(image)
+    height, width = gray.shape
+    foreground = gray > DARK_LEVEL
+    extent, occupied, widths = _row_extent_mask(foreground)
+    background = ~extent
+
+    corner = max(2, min(height, width) // 8)
+    corners = np.concatenate([gray[:corner, :corner].ravel(), gray[:corner, -corner:].ravel(),
+                              gray[-corner:, :corner].ravel(), gray[-corner:, -corner:].ravel()])
+    tissue = gray[foreground]
+
+    if tissue.size:
+        histogram = np.bincount(tissue.astype(np.uint8), minlength=256)
+        mode = int(histogram.argmax())
+        peak = float(np.mean(np.abs(tissue - mode) <= 15))
+        bright = float(np.mean(tissue >= BRIGHT_LEVEL))
+    else:
+        peak = bright = 0.0
+
+    # Speckle: mean absolute Laplacian within the tissue relative to its spread
+    laplacian = np.abs(4 * gray[1:-1, 1:-1] - gray[:-2, 1:-1] - gray[2:, 1:-1] - gray[1:-1, :-2] - gray[1:-1, 2:])
+    inner = foreground[1:-1, 1:-1]
+    speckle = float(laplacian[inner].mean() / (tissue.std() + 1e-6)) if inner.any() and tissue.size > 1 else 0.0
+
+    colour = 0.0
+    if rgb is not None:
+        colour = float(np.mean((rgb.max(axis=2) - rgb.min(axis=2)) > 30))
+
+    return {
+        'aspect': width / float(height),
+        'fill': float(extent.mean()),
+        'corner_dark': float(np.mean(corners <= DARK_LEVEL)),
+        'circle': _disc_iou(extent),
+        'fan': _fan_score(widths, occupied),
+        'bright': float(np.clip(bright * 20, 0, 1)),
+        'peak': peak,
+        'background_noise': float(np.clip(gray[background].std() / 4, 0, 1)) if background.any() else 0.0,
+        'speckle': float(np.clip(speckle / 2, 0, 1)),
+        'colour': float(np.clip(colour * 20, 0, 1)),
+    }
+
+
+def _logits(f):
+    # A disc-shaped field of view only counts if the frame corners around it are empty
+    rounded = f['circle'] * f['corner_dark'] * (1 - f['fan'])
+    return np.array([
+        # X-ray: anatomy fills a usually non-square frame
+        4 * f['fill'] - 3 * f['corner_dark'] - 2 * rounded - 3 * f['fan'] + (0.5 if abs(f['aspect'] - 1) > 0.05 else 0),
+        # CT: round body in a noiseless black field, bright bone, narrow soft-tissue band
+        4 * rounded + 2 * f['corner_dark'] + 2 * f['bright'] + 2 * f['peak'] - 3 * f['background_noise'] - 2 * f['fan'],
+        # MRI: round anatomy, noisy background, dark bone, broad tissue range
+        4 * rounded + 2 * f['corner_dark'] + 3 * f['background_noise'] - 2 * f['bright'] + (1 - f['peak']) - 2 * f['fan'],
+        # Ultrasound: fan-shaped sector, speckle, colour Doppler overlays
+        6 * f['fan'] + 3 * f['colour'] + 2 * f['speckle'] - 2 * rounded,
+    ])
+
+
+def classify_modality(image):
+    """Return a ModalityPrediction ('xray', 'ct', 'mri' or 'ultrasound') for a PIL image"""
+    tagged = image.info.get('dicom_modality')
+    page = DICOM_MODALITY_PAGES.get(tagged)
+    if page:
+        probabilities = {label: (1.0 if label == page else 0.0) for label in MODALITY_LABELS}
+        return ModalityPrediction(page, 1.0, probabilities, {'dicom_modality': tagged}, 'dicom')
+
+    features = extract_features(image)
+    logits = _logits(features)
+    weights = np.exp(logits - logits.max())
+    weights /= weights.sum()
+    probabilities = dict(zip(MODALITY_LABELS, (float(w) for w in weights)))
+    label = max(probabilities, key=probabilities.get)
+    return ModalityPrediction(label, probabilities[label], probabilities, features, 'heuristic')
+
+
+def answers_locally(prediction, threshold=CLASSIFIER_MIN_CONFIDENCE):
+    """Whether a prediction is trusted without asking Gemini: a DICOM tag, or a heuristic at threshold"""
+    return prediction.source == 'dicom' or prediction.confidence >= threshold
+
+
+def explain(prediction):
+    """Short human-readable reasons for a prediction"""
+    if prediction.source == 'dicom':
+        return [f"DICOM Modality tag is {prediction.features['dicom_modality']}"]
+    f = prediction.features
+    reasons = []
+    if f['fan'] > 0.5:
+        reasons.append("fan-shaped sector field of view typical of ultrasound")
+    if f['colour'] > 0.5:
+        reasons.append("colour overlay consistent with Doppler imaging")
+    if f['circle'] > 0.85 and f['corner_dark'] > 0.8:
+        reasons.append("round cross-section on a dark background")
+    if f['bright'] > 0.5 and prediction.label == 'ct':
+        reasons.append("saturated bone densities")
+    if f['background_noise'] > 0.5:
+        reasons.append("noise in the background typical of MR acquisition")
+    if f['fill'] > 0.85:
+        reasons.append("anatomy fills the whole frame, as on a projection radiograph")
+    return reasons or ["overall intensity distribution and layout"]
+
+
+def local_classification_report(prediction):
+    """Format a locally decided classification like the Gemini classification report"""
+    reasons = "\n".join(f"- {reason}" for reason in explain(prediction))
+    return (f"**Classification**: {MODALITY_LABELS[prediction.label]}\n\n"
+            f"**Confidence**: {prediction.confidence:.0%}\n\n"
+            f"**Reasoning**:\n{reasons}\n\n"
+            f"_Classified locally from image features; no Gemini call was needed._")
+
+
+def parse_modality_label(text):
+    """Return the modality named first in a classification report, or None"""
+    patterns = [('ultrasound', r'ultra\s*sound|sonograph'), ('mri', r'\bMRI?\b|magnetic resonance'),
+                ('ct', r'\bCT\b|computed tomography'), ('xray', r'x-?\s?ray|radiograph')]
+    first = None
+    for label, pattern in patterns:
+        match = re.search(pattern, text or '', re.IGNORECASE)
+        if match and (first is None or match.start() < first[0]):
+            first = (match.start(), label)
+    return first[1] if first else None
+
+
+def record_local():
+    with _stats_lock:
+        _stats['local'] += 1
+
+
+def record_remote(prediction, remote_report):
+    """Count a Gemini classification and whether it agrees with the local prediction"""
+    remote_label = parse_modality_label(remote_report)
+    with _stats_lock:
+        _stats['remote'] += 1
+        if remote_label is not None:
+            _stats['remote_compared'] += 1
+            _stats['remote_agreed'] += int(remote_label == prediction.label)
+    return remote_label
+
+
+def classifier_stats():
+    """Return how many classifications were answered locally and agreement on the rest"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['calls_avoided'] = stats['local']
+    stats['agreement_rate'] = (stats['remote_agreed'] / stats['remote_compared']
+                               if stats['remote_compared'] else None)
+    return stats
@@ -5,7 +5,9 @@ import streamlit as st
 from PIL import Image
 import google.generativeai as genai
 from datetime import datetime
-from utils import process_image, generate_report_with_retry, create_pdf_report
+from utils import (process_image, generate_report_with_retry, lazy_pdf_report, archive_report, check_modality_routing,
+                   show_key_slice_selection, series_prompt, make_thumbnail, warn_near_duplicate, check_image_quality,
+                   show_window_control)
 
 def show_mri_page():
     """Display the MRI report page"""
@@ -41,46 +43,85 @@ def show_mri_page():
     
     # File upload
     st.markdown("### 📤 Upload Medical Image")
-    uploaded_file = st.file_uploader(
-        "Choose a medical image file", 
-        type=["jpg", "jpeg", "png", "dicom"],
-        help="Supported formats: JPG, JPEG, PNG, DICOM"
-    )
+    series_mode = st.toggle("Upload a whole series (zip or multiple slices)",
+                            help="The most informative key slices are tiled into one montage and analysed in a single request")
+    if series_mode:
+        key_slice_count = st.slider("Key slices to analyse", min_value=2, max_value=16, value=12)
+        uploaded_file = st.file_uploader(
+            "Choose the slices of a series, or a zip archive of them", 
+            type=["jpg", "jpeg", "png", "tif", "tiff", "dcm", "dicom", "zip"],
+            accept_multiple_files=True,
+            help="Supported formats: JPG, JPEG, PNG, TIFF (8/16-bit), DICOM (.dcm), ZIP"
+        )
+    else:
+        uploaded_file = st.file_uploader(
+            "Choose a medical image file", 
+            type=["jpg", "jpeg", "png", "tif", "tiff", "dcm", "dicom"],
+            help="Supported formats: JPG, JPEG, PNG, TIFF (8/16-bit), DICOM (.dcm)"
+        )
     
-    if uploaded_file is not None:
+    if uploaded_file:
         # Two column layout
         col1, col2 = st.columns([1, 1])
         
         with col1:
-            st.markdown("### 🖼️ Uploaded Image")
-            image = process_image(uploaded_file)
-            if image:
-                st.image(image, use_container_width=True, caption=f"Uploaded: {uploaded_file.name}")
+            if series_mode:
+                st.markdown("### 🖼️ Key Slices")
+                key_slices = show_key_slice_selection(uploaded_file, key_slice_count, modality='mri')
+                if key_slices:
+                    # One montage of all key slices: a single request, and the image shown in the PDF
+                    selection, montage = key_slices
+                    quality_ok = True
+                    image = montage.image
+                    report_input = montage.image
+                    report_prompt = series_prompt(prompt, selection, montage)
+                else:
+                    image = None
+            else:
+                st.markdown("### 🖼️ Uploaded Image")
+                image = process_image(uploaded_file, 'mri')
+                image = show_window_control(image, 'mri')
+                report_input = image
+                report_prompt = prompt
+            if image and not series_mode:
+                st.image(make_thumbnail(image), use_container_width=True, caption=f"Uploaded: {uploaded_file.name}")
                 
                 # Image info
                 st.markdown(f"""
                 <div class="feature-card">
                     <b>File Name:</b> {uploaded_file.name}<br>
                     <b>File Size:</b> {uploaded_file.size / 1024:.2f} KB<br>
-                    <b>Image Dimensions:</b> {image.size[0]} x {image.size[1]} px
+                    <b>Image Dimensions:</b> {image.info['original_size'][0]} x {image.info['original_size'][1]} px
                 </div>
                 """, unsafe_allow_html=True)
+                
+                # Point DICOM studies of another modality to the right page
+                check_modality_routing(image, 'mri')
+                
+                # Point out images that were analysed before
+                warn_near_duplicate(image, prompt)
+                
+                # Reject blank or tiny images before they reach the model
+                quality_ok = check_image_quality(image, 'mri')
         
         with col2:
             st.markdown("### 📊 Analysis Results")
             
-            if st.button("🚀 Generate Report", use_container_width=True, type="primary"):
-                result = generate_report_with_retry(image, prompt, model_name='gemini-2.0-flash-lite')
+            if st.button("🚀 Generate Report", use_container_width=True, type="primary",
+                         disabled=not (image and quality_ok)):
+                # Stream the report into the page as it is generated
+                st.markdown('<div class="report-box">', unsafe_allow_html=True)
+                report_placeholder = st.empty()
+                result = generate_report_with_retry(report_input, report_prompt, model_name='gemini-2.0-flash-lite',
+                                                    placeholder=report_placeholder, modality='mri')
+                st.markdown('</div>', unsafe_allow_html=True)
                 
                 if result:
-                    st.markdown('<div class="report-box">', unsafe_allow_html=True)
-                    st.markdown(result)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
                     # Store in session state for download
                     st.session_state['report_text'] = result
                     st.session_state['report_image'] = image
                     st.session_state['report_type'] = report_type
+                    st.session_state['report_id'] = archive_report(result, image, report_type)
                     
                     st.success("✅ Report generated successfully!")
                 else:
@@ -115,26 +156,28 @@ def show_mri_page():
                 if referring_physician:
                     patient_info["Referring Physician"] = referring_physician
                 
-                pdf_data = create_pdf_report(
+                # Rendered only when the button is clicked, and memoized, so edits to the form stay cheap
+                pdf_data = lazy_pdf_report(
                     st.session_state['report_text'],
                     st.session_state['report_image'],
                     st.session_state['report_type'],
-                    patient_info if patient_info else None
+                    patient_info if patient_info else None,
+                    report_id=st.session_state.get('report_id')
                 )
                 
-                if pdf_data:
-                    st.download_button(
-                        label="📑 Download as PDF",
-                        data=pdf_data,
-                        file_name=f"{report_type.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                        mime="application/pdf",
-                        use_container_width=True,
-                        type="primary"
-                    )
+                st.download_button(
+                    label="📑 Download as PDF",
+                    data=pdf_data,
+                    file_name=f"{report_type.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                    mime="application/pdf",
+                    use_container_width=True,
+                    type="primary"
+                )
             
             with col3:
                 if st.button("🔄 Clear Results", use_container_width=True):
                     del st.session_state['report_text']
                     del st.session_state['report_image']
                     del st.session_state['report_type']
+                    st.session_state.pop('report_id', None)
                     st.rerun()
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+PDF rendering engine for MedInsight AI - RadiologyAI Pro
+
+Renders reports entirely in memory: documents are built into a BytesIO buffer
+and images are handed to ReportLab as in-memory ImageReaders, so a render never
+touches the disk or leaves temporary files behind. The stylesheet and the
+report paragraph styles are built once per process and shared by every render.
+Images are resampled to the print resolution of the frame they are drawn in and
+embedded as JPEG, or as Flate-compressed grayscale/RGB when they are flat
+graphics that JPEG would smear; page streams are compressed. Finished PDFs can
+be memoized by a content key in a small in-process LRU, so a report that has
+not changed is never rendered twice.
+"""
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+from reportlab import rl_config
+from reportlab.lib.colors import HexColor
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable, SimpleDocTemplate
+from image_pipeline import is_grayscale
+
+# Resolution images are resampled to for the frame they are printed in (None or 0 keeps every pixel)
+PDF_IMAGE_DPI = int(os.getenv('PDF_IMAGE_DPI', 200))
+# 'auto' picks JPEG for continuous-tone images and Flate for flat graphics; 'jpeg' or 'flate' forces one
+PDF_IMAGE_FORMAT = os.getenv('PDF_IMAGE_FORMAT', 'auto').lower()
+PDF_JPEG_QUALITY = int(os.getenv('PDF_JPEG_QUALITY', 88))
+# Images with at most this many distinct colours (diagrams, flat fills) are embedded losslessly
+FLATE_MAX_COLOURS = 64
+
+# Binary streams are a quarter smaller without the ASCII85 wrapper; every modern reader accepts them
+rl_config.useA85 = 0
+
+# Rendered PDFs kept in memory, keyed by a hash of everything that goes into them
+PDF_CACHE_ENTRIES = int(os.getenv('PDF_CACHE_ENTRIES', 32))
+
+_styles = None
+_styles_lock = threading.Lock()
+_pdf_memo = OrderedDict()
+_pdf_memo_lock = threading.Lock()
+_pdf_memo_stats = {'hits': 0, 'renders': 0}
+_render_stats = {'pdfs': 0, 'bytes': 0, 'seconds': 0.0, 'last_bytes': None}
+_render_stats_lock = threading.Lock()
+
+
+def get_pdf_styles():
+    """Return the shared report styles ('normal', 'title', 'heading'), building them on first use"""
+    global _styles
+    if _styles is None:
+        with _styles_lock:
+            if _styles is None:
+                stylesheet = getSampleStyleSheet()
+                _styles = {
+                    'normal': stylesheet['Normal'],
+                    'title': ParagraphStyle(
+                        'CustomTitle',
+                        parent=stylesheet['Heading1'],
+                        fontSize=24,
+                        textColor=HexColor('#1e3a8a'),
+                        spaceAfter=30,
+                        alignment=TA_CENTER
+                    ),
+                    'heading': ParagraphStyle(
+                        'CustomHeading',
+                        parent=stylesheet['Heading2'],
+                        fontSize=16,
+                        textColor=HexColor('#667eea'),
+                        spaceAfter=12,
+                        spaceBefore=12
+                    ),
+                }
+    return _styles
+
+
+def print_image(image, width, height, dpi=PDF_IMAGE_DPI, image_format=PDF_IMAGE_FORMAT):
+    """Prepare a PIL image for a width x height point frame
+
+    Returns (ImageReader, encoding, pixel size). The image is only ever scaled
+    down, to dpi pixels per inch of the frame; grayscale content drops to one
+    channel, and the pixels are embedded as JPEG or handed to ReportLab raw to
+    be Flate-compressed.
+    """
+    encoding = image_format
+    if encoding not in ('jpeg', 'flate'):
+        # Counted before resampling, which blends flat colours at every edge
+        sample = image.resize((min(image.width, 512), min(image.height, 512)), Image.NEAREST)
+        encoding = 'flate' if sample.getcolors(FLATE_MAX_COLOURS) is not None else 'jpeg'
+
+    if dpi:
+        target = (max(1, round(width / 72 * dpi)), max(1, round(height / 72 * dpi)))
+        size = (min(image.width, target[0]), min(image.height, target[1]))
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+    if is_grayscale(image):
+        image = image if image.mode == 'L' else image.convert('L')
+    elif image.mode != 'RGB':
+        if 'A' in image.mode:
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[3])
+            image = background
+        else:
+            image = image.convert('RGB')
+
+    if encoding == 'jpeg':
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=PDF_JPEG_QUALITY, optimize=True)
+        buffer.seek(0)
+        return ImageReader(buffer), encoding, image.size
+    return ImageReader(image), encoding, image.size
+
+
+class PILImageFlowable(Flowable):
+    """Draw a PIL image from memory at a fixed size, resampled to print resolution"""
+
+    def __init__(self, image, width, height, h_align='CENTER', dpi=PDF_IMAGE_DPI, image_format=PDF_IMAGE_FORMAT):
+        super().__init__()
+        self.reader, self.encoding, self.pixel_size = print_image(image, width, height, dpi, image_format)
+        self.draw_width = width
+        self.draw_height = height
+        self.hAlign = h_align
+
+    def wrap(self, available_width, available_height):
+        return self.draw_width, self.draw_height
+
+    def draw(self):
+        self.canv.drawImage(self.reader, 0, 0, self.draw_width, self.draw_height, mask='auto')
+
+
+def render_pdf(story, pagesize=A4):
+    """Build a list of flowables into a compressed PDF and return its bytes"""
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=pagesize, pageCompression=1)
+    doc.build(story)
+    pdf = buffer.getvalue()
+    with _render_stats_lock:
+        _render_stats['pdfs'] += 1
+        _render_stats['bytes'] += len(pdf)
+        _render_stats['seconds'] += time.perf_counter() - started
+        _render_stats['last_bytes'] = len(pdf)
+    return pdf
+
+
+def memoized_pdf(key, build):
+    """Return the PDF bytes stored under key, calling build() to render them on a miss"""
+    with _pdf_memo_lock:
+        pdf = _pdf_memo.get(key)
+        if pdf is not None:
+            _pdf_memo.move_to_end(key)
+            _pdf_memo_stats['hits'] += 1
+            return pdf
+    # Render outside the lock; two concurrent misses on one key both render, and the last one is kept
+    pdf = build()
+    with _pdf_memo_lock:
+        _pdf_memo_stats['renders'] += 1
+        if PDF_CACHE_ENTRIES > 0:
+            _pdf_memo[key] = pdf
+            _pdf_memo.move_to_end(key)
+            while len(_pdf_memo) > PDF_CACHE_ENTRIES:
+                _pdf_memo.popitem(last=False)
+    return pdf
+
+
+def pdf_memo_stats():
+    """Return how many PDFs were rendered and how many requests were served from memory"""
+    with _pdf_memo_lock:
+        stats = dict(_pdf_memo_stats)
+        stats['entries'] = len(_pdf_memo)
+    return stats
+
+
+def pdf_render_stats():
+    """Return the number of PDFs built, their mean size and render time, and the last size"""
+    with _render_stats_lock:
+        stats = dict(_render_stats)
+    stats['mean_bytes'] = stats['bytes'] / stats['pdfs'] if stats['pdfs'] else None
+    stats['mean_seconds'] = stats['seconds'] / stats['pdfs'] if stats['pdfs'] else None
+    return stats
@@ -0,0 +1,166 @@
+"""
+PDF text extraction for MedInsight AI - RadiologyAI Pro
+
+Extracts the text of uploaded medical reports for hospital matching. Uploads
+are capped in bytes and pages, so a long scanned bundle cannot stall the page;
+larger documents are split into one page range per worker process (PyPDF2 is
+pure Python and holds the GIL), so each worker receives and parses the PDF only
+once, with an overall deadline that the workers also enforce page by page. Page texts are joined once at the end, every page is timed, and
+results are cached by the SHA-256 of the PDF bytes, so clicking the button
+again does not re-read the document.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+import PyPDF2
+
+PDF_TEXT_MAX_BYTES = int(os.getenv('PDF_TEXT_MAX_BYTES', 25 * 1024 * 1024))
+# Pages read from one document; the rest are skipped and the result is marked truncated
+PDF_TEXT_MAX_PAGES = int(os.getenv('PDF_TEXT_MAX_PAGES', 60))
+# Worker processes for page-parallel extraction (0 or 1 extracts in the calling thread)
+PDF_TEXT_WORKERS = int(os.getenv('PDF_TEXT_WORKERS', min(4, os.cpu_count() or 1)))
+# Documents with fewer pages are extracted inline; a worker round trip costs more than it saves
+PDF_TEXT_PARALLEL_MIN_PAGES = int(os.getenv('PDF_TEXT_PARALLEL_MIN_PAGES', 8))
+# Seconds to wait for the workers before returning the pages that are done; workers stop at it too
+PDF_TEXT_DEADLINE = float(os.getenv('PDF_TEXT_DEADLINE', 20))
+PDF_TEXT_CACHE_ENTRIES = int(os.getenv('PDF_TEXT_CACHE_ENTRIES', 64))
+
+# truncated: the page cap skipped pages; unread_pages: capped pages that failed or missed the deadline
+PdfText = namedtuple('PdfText', ['text', 'pages', 'total_pages', 'page_seconds', 'truncated', 'unread_pages',
+                                 'seconds', 'cached'])
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _read_upload(pdf_file, max_bytes):
+    """Return the bytes of an upload (bytes, path or file-like), refusing anything above max_bytes"""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        data = bytes(pdf_file)
+    elif isinstance(pdf_file, str):
+        with open(pdf_file, 'rb') as handle:
+            data = handle.read(max_bytes + 1)
+    else:
+        if hasattr(pdf_file, 'seek'):
+            pdf_file.seek(0)
+        data = pdf_file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"PDF is larger than the {max_bytes / (1024 * 1024):.0f} MB limit")
+    return data
+
+
+def _extract_range(data, start, stop, stop_at=None):
+    """Extract pages [start, stop) of a PDF; returns a list of (text, seconds). Runs in a worker process.
+
+    Stops early, returning the pages done so far, once the wall-clock time
+    stop_at has passed, so an abandoned document does not keep a worker busy.
+    """
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    pages = []
+    for number in range(start, stop):
+        if stop_at is not None and time.time() >= stop_at:
+            break
+        started = time.perf_counter()
+        try:
+            text = reader.pages[number].extract_text() or ''
+        except Exception:
+            # One malformed page should not lose the rest of the report
+            text = ''
+        pages.append((text, time.perf_counter() - started))
+    return pages
+
+
+def get_extraction_pool():
+    """Return the process-wide extraction worker pool, starting it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a threaded server process can deadlock the child
+                _pool = ProcessPoolExecutor(max_workers=PDF_TEXT_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _discard_pool():
+    """Drop a broken pool so the next extraction starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _page_ranges(pages, parts):
+    """Split range(pages) into up to parts contiguous (start, stop) ranges"""
+    step = max(1, -(-pages // parts))
+    return [(start, min(start + step, pages)) for start in range(0, pages, step)]
+
+
+def extract_pdf_text(pdf_file, max_pages=PDF_TEXT_MAX_PAGES, max_bytes=PDF_TEXT_MAX_BYTES,
+                     workers=PDF_TEXT_WORKERS, deadline=PDF_TEXT_DEADLINE):
+    """Extract the text of a PDF and return a PdfText; raises ValueError if it is too large or unreadable"""
+    started = time.perf_counter()
+    stop_at = time.time() + deadline
+    data = _read_upload(pdf_file, max_bytes)
+    key = (hashlib.sha256(data).hexdigest(), max_pages)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached._replace(cached=True, seconds=time.perf_counter() - started)
+
+    try:
+        total_pages = len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+    except Exception as e:
+        raise ValueError(f"Not a readable PDF: {e}") from e
+    pages = min(total_pages, max_pages)
+
+    results = [None] * pages
+    if workers > 1 and pages >= PDF_TEXT_PARALLEL_MIN_PAGES:
+        futures = {}
+        try:
+            pool = get_extraction_pool()
+            # Every task pickles the whole PDF and parses it again, so send one per worker
+            for start, stop in _page_ranges(pages, workers):
+                futures[pool.submit(_extract_range, data, start, stop, stop_at)] = start
+            done, not_done = wait(futures, timeout=max(0.0, stop_at - time.time()))
+        except Exception:
+            # Broken or unavailable pool: fall back to extracting inline
+            _discard_pool()
+            futures, done, not_done = {}, set(), set()
+        if not_done:
+            # A running task cannot be cancelled; start the next document on fresh workers
+            # instead of queueing it behind the pages that are still being read
+            _discard_pool()
+        for future in done:
+            try:
+                for offset, page in enumerate(future.result()):
+                    results[futures[future] + offset] = page
+            except Exception:
+                pass
+        if not futures:
+            results = _extract_range(data, 0, pages, stop_at)
+    else:
+        results = _extract_range(data, 0, pages, stop_at)
+
+    # Pages not finished before the deadline count as empty
+    results += [None] * (pages - len(results))
+    unread_pages = sum(page is None for page in results)
+    results = [page or ('', 0.0) for page in results]
+    text = "\n".join(page_text for page_text, _ in results)
+    result = PdfText(text, pages, total_pages, [seconds for _, seconds in results],
+                     pages < total_pages, unread_pages, time.perf_counter() - started, False)
+    if not unread_pages and PDF_TEXT_CACHE_ENTRIES > 0:
+        with _cache_lock:
+            _cache[key] = result
+            while len(_cache) > PDF_TEXT_CACHE_ENTRIES:
+                _cache.popitem(last=False)
+    return result
@@ -0,0 +1,266 @@
+"""
+Perceptual hashing for MedInsight AI - RadiologyAI Pro
+
+The exact report cache misses an image that was re-exported, re-compressed or
+slightly cropped. Each analysed image gets a 64-bit dHash and pHash computed
+with NumPy, and the hashes are kept in a BK-tree so that prior images within a
+small Hamming distance are found without scanning every entry. The hashes are
+stored next to the report cache on disk, so a near-duplicate upload can reuse
+the stored report or warn the user before another Gemini call is spent.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+import numpy as np
+from PIL import Image
+from report_cache import REPORT_CACHE_PATH, REPORT_CACHE_MAX_ENTRIES
+
+# Largest pHash Hamming distance (out of 64 bits) at which the user is warned of a near-duplicate
+NEAR_DUPLICATE_DISTANCE = int(os.getenv('NEAR_DUPLICATE_DISTANCE', 10))
+# Largest distance at which the stored report for the same prompt is reused; -1 (the default)
+# only warns, since a near-identical image can still differ in a clinically relevant detail
+NEAR_DUPLICATE_REUSE_DISTANCE = int(os.getenv('NEAR_DUPLICATE_REUSE_DISTANCE', -1))
+
+HASH_SIZE = 8
+PHASH_HIGHFREQ_FACTOR = 4
+
+NearDuplicate = namedtuple('NearDuplicate', ['cache_key', 'context', 'distance', 'dhash_distance'])
+ImageHashes = namedtuple('ImageHashes', ['phash', 'dhash'])
+
+
+def _grayscale(image, size):
+    """Downscale to size (width, height) in 'L' mode, box-reducing large images first"""
+    small = image if image.mode == 'L' else image.convert('L')
+    return small.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a (size+1) x size thumbnail"""
+    pixels = np.asarray(_grayscale(image, (hash_size + 1, hash_size)), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis as an n x n matrix"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(HASH_SIZE * PHASH_HIGHFREQ_FACTOR)
+
+
+def phash(image, hash_size=HASH_SIZE):
+    """DCT hash: low-frequency coefficients of a 32x32 thumbnail compared with their median"""
+    size = hash_size * PHASH_HIGHFREQ_FACTOR
+    pixels = np.asarray(_grayscale(image, (size, size)), dtype=np.float64)
+    basis = _DCT if size == _DCT.shape[0] else _dct_matrix(size)
+    coefficients = basis @ pixels @ basis.T
+    low = coefficients[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low))
+
+
+def image_hashes(image):
+    """Return the ImageHashes (pHash, dHash) of a PIL image"""
+    return ImageHashes(phash(image), dhash(image))
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes under the Hamming distance
+
+    A search for everything within distance d only descends into children whose
+    edge distance lies in [dist - d, dist + d], so lookups visit a small part of
+    the tree when d is small.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key, value):
+        self._size += 1
+        node = [key, [value], {}]
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(key, current[0])
+            if distance == 0:
+                current[1].append(value)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, key, max_distance):
+        """Return (distance, value) pairs within max_distance of key, nearest first"""
+        if self._root is None:
+            return []
+        found = []
+        pending = [self._root]
+        while pending:
+            node_key, values, children = pending.pop()
+            distance = hamming_distance(key, node_key)
+            if distance <= max_distance:
+                found.extend((distance, value) for value in values)
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class NearDuplicateIndex:
+    """Perceptual hashes of analysed images, persisted in SQLite and searched through a BK-tree
+
+    Each entry links an image's hashes to the report cache key it was stored
+    under and a context key (prompt and model), so that only reports produced
+    for the same question are reused. Entries written by other processes are
+    picked up incrementally on the next lookup. A BK-tree cannot drop entries,
+    so once it holds twice max_entries it is rebuilt from the entries that are
+    still stored.
+    """
+
+    def __init__(self, path=REPORT_CACHE_PATH, max_entries=REPORT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._tree = BKTree()
+        self._last_id = 0
+        # Entries of a memory-only index, which has no table to rebuild from
+        self._memory = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'matches': 0, 'reused': 0}
+        self._conn = None
+        try:
+            self._conn = self._connect()
+        except (sqlite3.Error, OSError):
+            # Memory-only index if the disk store is unavailable
+            self._conn = None
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_hashes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cache_key TEXT NOT NULL,
+                context TEXT NOT NULL,
+                phash TEXT NOT NULL,
+                dhash TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        return conn
+
+    def _sync(self):
+        """Load entries added since the last sync (by this or another process) into the tree"""
+        if self._conn is None:
+            return
+        for rebuild in (False, True):
+            if rebuild:
+                if len(self._tree) <= 2 * self.max_entries:
+                    return
+                # Drop the entries pruned from the table since the last rebuild
+                self._tree = BKTree()
+                self._last_id = 0
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, cache_key, context, phash, dhash FROM image_hashes WHERE id > ? ORDER BY id",
+                    (self._last_id,)
+                ).fetchall()
+            except sqlite3.Error:
+                return
+            for row_id, cache_key, context, phash_hex, dhash_hex in rows:
+                self._tree.add(int(phash_hex, 16), (cache_key, context, int(dhash_hex, 16)))
+                self._last_id = row_id
+
+    def add(self, hashes, cache_key, context):
+        """Record the hashes of an image whose report was stored under cache_key"""
+        with self._lock:
+            if self._conn is None:
+                self._memory.append((hashes.phash, (cache_key, context, hashes.dhash)))
+                self._tree.add(*self._memory[-1])
+                if len(self._tree) > 2 * self.max_entries:
+                    self._tree = BKTree()
+                    for key, value in self._memory:
+                        self._tree.add(key, value)
+                return
+            try:
+                self._conn.execute(
+                    "INSERT INTO image_hashes(cache_key, context, phash, dhash, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (cache_key, context, f"{hashes.phash:016x}", f"{hashes.dhash:016x}", time.time())
+                )
+                self._conn.execute(
+                    "DELETE FROM image_hashes WHERE id IN ("
+                    "SELECT id FROM image_hashes ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            except sqlite3.Error:
+                pass
+            self._sync()
+
+    def find(self, hashes, context=None, max_distance=NEAR_DUPLICATE_DISTANCE):
+        """Return NearDuplicate matches, nearest first, optionally only for one context
+
+        A pHash match is confirmed by a dHash within twice the distance, which
+        rejects the rare pHash collision between different images.
+        """
+        with self._lock:
+            self._sync()
+            self._stats['lookups'] += 1
+            matches = []
+            for distance, (cache_key, entry_context, entry_dhash) in self._tree.search(hashes.phash, max_distance):
+                if context is not None and entry_context != context:
+                    continue
+                dhash_distance = hamming_distance(hashes.dhash, entry_dhash)
+                if dhash_distance <= 2 * max_distance:
+                    matches.append(NearDuplicate(cache_key, entry_context, distance, dhash_distance))
+            if matches:
+                self._stats['matches'] += 1
+            return matches
+
+    def record_reuse(self):
+        with self._lock:
+            self._stats['reused'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._tree))
+
+
+_near_duplicate_index = None
+_near_duplicate_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index():
+    """Return the process-wide near-duplicate index, creating it on first use"""
+    global _near_duplicate_index
+    if _near_duplicate_index is None:
+        with _near_duplicate_index_lock:
+            if _near_duplicate_index is None:
+                _near_duplicate_index = NearDuplicateIndex()
+    return _near_duplicate_index
@@ -0,0 +1,119 @@
+"""
+Pre-flight image quality gate for MedInsight AI - RadiologyAI Pro
+
+Runs cheap vectorised checks on the decoded image before any Gemini call:
+minimum resolution, near-constant (blank) images, exposure clipping and
+variance-of-Laplacian sharpness. Blank and tiny images are rejected; clipped
+or blurred ones are flagged so the user can decide. Every check is timed, and
+thresholds are set per modality and can be overridden from the environment as
+QUALITY_<MODALITY>_<THRESHOLD>, e.g. QUALITY_XRAY_MIN_SHARPNESS=8.
+"""
+import os
+import time
+from collections import namedtuple
+import numpy as np
+
+# Longest side of the grayscale copy the checks run on; sharpness is measured at this scale
+QUALITY_ANALYSIS_SIDE = 512
+
+DEFAULT_THRESHOLDS = {
+    'min_side': 256,            # shorter image side in pixels, below which the image is rejected
+    'min_std': 3.0,             # intensity standard deviation (0-255) below which the image is blank
+    'max_highlight_clip': 0.25,  # fraction of pixels at full white
+    'max_shadow_clip': 0.6,     # fraction of pixels at full black
+    'min_sharpness': 4.0,       # variance of the Laplacian on the analysis copy
+}
+# Per-modality differences from the defaults; CT, MRI and ultrasound have black backgrounds by design,
+# and CT/MR matrices go down to 128 x 128 (DWI/ADC maps, reformats)
+MODALITY_THRESHOLDS = {
+    'xray': {'min_side': 512, 'min_sharpness': 5.0},
+    'ct': {'min_side': 128, 'max_shadow_clip': 0.9},
+    'mri': {'min_side': 128, 'max_shadow_clip': 0.9, 'min_sharpness': 3.0},
+    'ultrasound': {'max_shadow_clip': 0.9, 'max_highlight_clip': 0.1},
+    'classification': {'min_side': 128, 'max_shadow_clip': 0.9, 'min_sharpness': 2.0},
+}
+
+REJECT = 'reject'
+FLAG = 'flag'
+
+QualityCheck = namedtuple('QualityCheck', ['name', 'value', 'threshold', 'passed', 'severity', 'seconds', 'message'])
+QualityReport = namedtuple('QualityReport', ['checks', 'rejected', 'flagged', 'seconds'])
+
+
+def quality_thresholds(modality=None):
+    """Return the thresholds for a modality, with QUALITY_<MODALITY>_<NAME> environment overrides"""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    thresholds.update(MODALITY_THRESHOLDS.get(modality, {}))
+    prefix = f"QUALITY_{modality.upper()}_" if modality else "QUALITY_"
+    for name in thresholds:
+        override = os.getenv(prefix + name.upper())
+        if override is not None:
+            thresholds[name] = float(override)
+    return thresholds
+
+
+def _analysis_copy(image):
+    """Grayscale float32 array of a copy whose longest side is about QUALITY_ANALYSIS_SIDE"""
+    gray = image if image.mode == 'L' else image.convert('L')
+    factor = max(1, max(gray.size) // QUALITY_ANALYSIS_SIDE)
+    if factor > 1:
+        gray = gray.reduce(factor)
+    return np.asarray(gray, dtype=np.float32)
+
+
+def laplacian_variance(pixels):
+    """Variance of the 4-neighbour Laplacian; low values mean little fine detail (blur)"""
+    if min(pixels.shape) < 3:
+        return 0.0
+    laplacian = (4 * pixels[1:-1, 1:-1] - pixels[:-2, 1:-1] - pixels[2:, 1:-1]
+                 - pixels[1:-1, :-2] - pixels[1:-1, 2:])
+    return float(laplacian.var())
+
+
+def run_quality_checks(image, modality=None):
+    """Run every check on a PIL image and return a QualityReport"""
+    thresholds = quality_thresholds(modality)
+    checks = []
+    started = time.perf_counter()
+
+    def timed(name, severity, threshold, measure, passes, message):
+        check_started = time.perf_counter()
+        value = measure()
+        passed = passes(value)
+        checks.append(QualityCheck(name, value, threshold, passed, severity,
+                                   time.perf_counter() - check_started, None if passed else message(value)))
+
+    original_size = image.info.get('original_size', image.size)
+    timed('resolution', REJECT, thresholds['min_side'],
+          lambda: min(original_size),
+          lambda side: side >= thresholds['min_side'],
+          lambda side: f"Image is only {original_size[0]} x {original_size[1]} px; "
+                       f"at least {thresholds['min_side']:g} px on the shorter side is needed.")
+
+    copy_started = time.perf_counter()
+    pixels = _analysis_copy(image)
+    copy_seconds = time.perf_counter() - copy_started
+
+    timed('contrast', REJECT, thresholds['min_std'],
+          lambda: float(pixels.std()),
+          lambda std: std >= thresholds['min_std'],
+          lambda std: f"Image is nearly uniform (intensity spread {std:.1f}); it looks blank.")
+    timed('highlight_clipping', FLAG, thresholds['max_highlight_clip'],
+          lambda: float(np.mean(pixels >= 254)),
+          lambda fraction: fraction <= thresholds['max_highlight_clip'],
+          lambda fraction: f"{fraction:.0%} of the image is saturated white; it may be overexposed.")
+    timed('shadow_clipping', FLAG, thresholds['max_shadow_clip'],
+          lambda: float(np.mean(pixels <= 1)),
+          lambda fraction: fraction <= thresholds['max_shadow_clip'],
+          lambda fraction: f"{fraction:.0%} of the image is pure black; it may be underexposed.")
+    timed('sharpness', FLAG, thresholds['min_sharpness'],
+          lambda: laplacian_variance(pixels),
+          lambda sharpness: sharpness >= thresholds['min_sharpness'],
+          lambda sharpness: f"Image looks blurred (sharpness {sharpness:.1f}, "
+                            f"expected at least {thresholds['min_sharpness']:g}).")
+
+    # The shared grayscale copy is charged to the checks that use it
+    checks = [c._replace(seconds=c.seconds + copy_seconds / 4) if c.name != 'resolution' else c for c in checks]
+    rejected = [c for c in checks if not c.passed and c.severity == REJECT]
+    flagged = [c for c in checks if not c.passed and c.severity == FLAG]
+    return QualityReport(checks, rejected, flagged, time.perf_counter() - started)
@@ -0,0 +1,187 @@
+"""
+Gemini rate limiter for MedInsight AI - RadiologyAI Pro
+
+Keeps a requests-per-minute and a tokens-per-minute token bucket for every
+model. Bucket state lives in a SQLite file shared by all worker processes (or
+in memory when no file is configured), so sessions queue for capacity instead
+of each discovering the same 429 on their own.
+"""
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+# Rate limit configuration (overridable from the environment)
+GEMINI_RATE_LIMIT_DB = os.getenv(
+    'GEMINI_RATE_LIMIT_DB',
+    os.path.join(os.path.expanduser('~'), '.medinsight', 'rate_limits.sqlite3')
+)
+GEMINI_RPM = float(os.getenv('GEMINI_RPM', 15))
+GEMINI_TPM = float(os.getenv('GEMINI_TPM', 250000))
+GEMINI_RATE_LIMIT_MAX_WAIT = float(os.getenv('GEMINI_RATE_LIMIT_MAX_WAIT', 30))
+
+# Approximate token cost of one image part and of one character of prompt text
+IMAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+
+def _env_name(model_name):
+    return re.sub(r'[^A-Z0-9]', '_', model_name.upper())
+
+
+def model_limits(model_name):
+    """Return (requests per minute, tokens per minute) for a model
+
+    Per-model overrides are read from GEMINI_RPM_<MODEL> and GEMINI_TPM_<MODEL>,
+    e.g. GEMINI_RPM_GEMINI_2_0_FLASH_LITE=30.
+    """
+    suffix = _env_name(model_name)
+    rpm = float(os.getenv(f'GEMINI_RPM_{suffix}', GEMINI_RPM))
+    tpm = float(os.getenv(f'GEMINI_TPM_{suffix}', GEMINI_TPM))
+    return rpm, tpm
+
+
+def estimate_tokens(contents):
+    """Roughly estimate the input tokens of a generate_content payload"""
+    if isinstance(contents, (str, dict)):
+        contents = [contents]
+    tokens = 0
+    for part in contents:
+        if isinstance(part, str):
+            tokens += len(part) // CHARS_PER_TOKEN + 1
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+class TokenBucketLimiter:
+    """Per-model RPM and TPM token buckets shared across threads and processes"""
+
+    def __init__(self, path=GEMINI_RATE_LIMIT_DB, max_wait=GEMINI_RATE_LIMIT_MAX_WAIT):
+        self.path = path
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._conn = None
+        if path:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS buckets (
+                        model TEXT NOT NULL,
+                        kind TEXT NOT NULL,
+                        tokens REAL NOT NULL,
+                        updated REAL NOT NULL,
+                        PRIMARY KEY (model, kind)
+                    )
+                """)
+            except (sqlite3.Error, OSError):
+                # Fall back to per-process buckets if the shared store is unavailable
+                self._conn = None
+
+    def _take(self, state, model_name, tokens, now):
+        """Refill both buckets and take capacity if possible; return seconds to wait"""
+        rpm, tpm = model_limits(model_name)
+        wait = 0.0
+        levels = {}
+        for kind, capacity, cost in (('requests', rpm, 1), ('tokens', tpm, min(tokens, tpm))):
+            level, updated = state.get(kind, (capacity, now))
+            level = min(capacity, level + (now - updated) * capacity / 60.0)
+            levels[kind] = (level, cost, capacity)
+            if level < cost:
+                wait = max(wait, (cost - level) * 60.0 / capacity)
+        if wait == 0.0:
+            return 0.0, {kind: (level - cost, now) for kind, (level, cost, _) in levels.items()}
+        return wait, {kind: (level, now) for kind, (level, _, _) in levels.items()}
+
+    def try_acquire(self, model_name, tokens=0):
+        """Take one request and tokens from the model's buckets
+
+        Returns 0 when capacity was taken, otherwise the number of seconds
+        until enough capacity will have refilled.
+        """
+        now = time.time()
+        with self._lock:
+            if self._conn is None:
+                state = self._buckets.setdefault(model_name, {})
+                wait, new_state = self._take(state, model_name, tokens, now)
+                state.update(new_state)
+                return wait
+
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = self._conn.execute(
+                        "SELECT kind, tokens, updated FROM buckets WHERE model = ?", (model_name,)
+                    ).fetchall()
+                    state = {kind: (level, updated) for kind, level, updated in rows}
+                    wait, new_state = self._take(state, model_name, tokens, now)
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO buckets(model, kind, tokens, updated) VALUES (?, ?, ?, ?)",
+                        [(model_name, kind, level, updated) for kind, (level, updated) in new_state.items()]
+                    )
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                return wait
+            except sqlite3.Error:
+                return 0.0
+
+    def drain(self, model_name):
+        """Empty a model's request bucket after the API reported a rate limit"""
+        now = time.time()
+        with self._lock:
+            if self._conn is None:
+                self._buckets.setdefault(model_name, {})['requests'] = (0.0, now)
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets(model, kind, tokens, updated) VALUES (?, 'requests', 0, ?)",
+                    (model_name, now)
+                )
+            except sqlite3.Error:
+                pass
+
+    async def acquire(self, model_name, tokens=0, max_wait=None):
+        """Wait for capacity on a model without blocking the event loop
+
+        Returns True once capacity was taken, or False if it would take longer
+        than max_wait seconds, in which case the caller should try another model.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        waited = 0.0
+        while True:
+            if self._conn is None:
+                wait = self.try_acquire(model_name, tokens)
+            else:
+                wait = await asyncio.to_thread(self.try_acquire, model_name, tokens)
+            if wait == 0.0:
+                return True
+            if waited + wait > max_wait:
+                return False
+            # Small jitter so queued callers do not all wake up on the same tick
+            wait += random.uniform(0, 0.05)
+            await asyncio.sleep(wait)
+            waited += wait
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter, creating it on first use"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = TokenBucketLimiter()
+    return _rate_limiter
@@ -0,0 +1,182 @@
+"""
+Report archive for MedInsight AI - RadiologyAI Pro
+
+Every generated report is kept in a SQLite archive together with the image it
+was generated from (stored as PNG at a print-ready size), its report type and
+the patient details entered when the PDF was downloaded. The archive is what
+bulk export renders PDFs from, so reports can be handed over long after the
+page session that produced them is gone. A report is archived once per
+(report type, text, image), however often it is regenerated or served from the
+report cache, and the archive is bounded by age and by entry count.
+"""
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from PIL import Image
+from image_pipeline import reduce_to_side
+from report_cache import cached_image_digest, content_key
+
+REPORT_ARCHIVE_PATH = os.getenv(
+    'REPORT_ARCHIVE_PATH',
+    os.path.join(os.path.expanduser('~'), '.medinsight', 'report_archive.sqlite3')
+)
+# Seconds a report is kept, and the most reports kept (oldest go first); 0 disables either bound
+REPORT_ARCHIVE_TTL = float(os.getenv('REPORT_ARCHIVE_TTL', 90 * 24 * 3600))
+REPORT_ARCHIVE_MAX_ENTRIES = int(os.getenv('REPORT_ARCHIVE_MAX_ENTRIES', 20000))
+# Longest side of archived images; comfortably above what the PDF frame prints
+ARCHIVE_IMAGE_SIDE = int(os.getenv('ARCHIVE_IMAGE_SIDE', 1024))
+# image.info entries the PDF report reads, kept alongside the archived image
+ARCHIVED_IMAGE_INFO = ('original_size', 'crop_box', 'window')
+
+
+class ReportArchive:
+    """Generated reports with their image, report type and patient details, persisted in SQLite"""
+
+    def __init__(self, path=REPORT_ARCHIVE_PATH, ttl=REPORT_ARCHIVE_TTL, max_entries=REPORT_ARCHIVE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        try:
+            self._conn = self._connect(path)
+        except (sqlite3.Error, OSError):
+            # Keep this process's reports in memory if the archive file is unavailable
+            self._conn = self._connect(':memory:')
+
+    def _connect(self, path):
+        directory = os.path.dirname(path) if path != ':memory:' else None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS archived_reports (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                report_type TEXT NOT NULL,
+                report_text TEXT NOT NULL,
+                patient_info TEXT,
+                image BLOB,
+                image_info TEXT,
+                content_hash TEXT
+            )
+        """)
+        if 'content_hash' not in {row[1] for row in conn.execute("PRAGMA table_info(archived_reports)")}:
+            # Archives created before deduplication
+            conn.execute("ALTER TABLE archived_reports ADD COLUMN content_hash TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS archived_reports_created_at ON archived_reports(created_at)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS archived_reports_content_hash ON archived_reports(content_hash)")
+        return conn
+
+    @staticmethod
+    def content_hash(report_text, image, report_type):
+        """SHA-256 identifying a report by its type, text and image pixels"""
+        return content_key(report_type.encode('utf-8'), report_text.encode('utf-8'),
+                           cached_image_digest(image) if image is not None else b'')
+
+    def _prune(self, now):
+        if self.ttl > 0:
+            self._conn.execute("DELETE FROM archived_reports WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries > 0:
+            self._conn.execute(
+                "DELETE FROM archived_reports WHERE id IN ("
+                "SELECT id FROM archived_reports ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def add(self, report_text, image=None, report_type="Medical Report", patient_info=None):
+        """Archive a report and return its id; a report that is already archived keeps its existing id"""
+        content_hash = self.content_hash(report_text, image, report_type)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM archived_reports WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        if row is not None:
+            return row[0]
+        image_bytes = image_info = None
+        if image is not None:
+            small = reduce_to_side(image, ARCHIVE_IMAGE_SIDE)
+            buffer = io.BytesIO()
+            small.save(buffer, 'PNG')
+            image_bytes = buffer.getvalue()
+            image_info = json.dumps({key: image.info[key] for key in ARCHIVED_IMAGE_INFO if image.info.get(key)})
+        now = time.time()
+        with self._lock:
+            # Another session may have archived the same report meanwhile; the unique hash keeps one copy
+            self._conn.execute(
+                "INSERT OR IGNORE INTO archived_reports"
+                "(created_at, report_type, report_text, patient_info, image, image_info, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (now, report_type, report_text, json.dumps(patient_info) if patient_info else None,
+                 image_bytes, image_info, content_hash)
+            )
+            report_id = self._conn.execute(
+                "SELECT id FROM archived_reports WHERE content_hash = ?", (content_hash,)
+            ).fetchone()[0]
+            self._prune(now)
+            return report_id
+
+    def set_patient_info(self, report_id, patient_info):
+        """Record the patient details a report was downloaded with"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE archived_reports SET patient_info = ? WHERE id = ?",
+                (json.dumps(patient_info) if patient_info else None, report_id)
+            )
+
+    def ids(self, since=None, until=None, report_type=None):
+        """Return the ids of reports created in [since, until) (Unix times), oldest first"""
+        query = "SELECT id FROM archived_reports WHERE created_at >= ? AND created_at < ?"
+        params = [since or 0, until or float('inf')]
+        if report_type:
+            query += " AND report_type = ?"
+            params.append(report_type)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query + " ORDER BY id", params)]
+
+    def load(self, report_id):
+        """Return a report as a dict (image decoded, image.info restored), or None if it does not exist"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, created_at, report_type, report_text, patient_info, image, image_info "
+                "FROM archived_reports WHERE id = ?",
+                (report_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        report_id, created_at, report_type, report_text, patient_info, image_bytes, image_info = row
+        image = None
+        if image_bytes:
+            image = Image.open(io.BytesIO(image_bytes))
+            image.load()
+            # JSON turns tuples into lists; the PDF report only indexes them
+            image.info.update(json.loads(image_info or '{}'))
+        return {
+            'id': report_id,
+            'created_at': created_at,
+            'report_type': report_type,
+            'report_text': report_text,
+            'patient_info': json.loads(patient_info) if patient_info else None,
+            'image': image,
+        }
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM archived_reports").fetchone()[0]
+
+
+_report_archive = None
+_report_archive_lock = threading.Lock()
+
+
+def get_report_archive():
+    """Return the process-wide report archive, creating it on first use"""
+    global _report_archive
+    if _report_archive is None:
+        with _report_archive_lock:
+            if _report_archive is None:
+                _report_archive = ReportArchive()
+    return _report_archive
@@ -0,0 +1,235 @@
+"""
+Report cache for MedInsight AI - RadiologyAI Pro
+
+Generated reports are cached by a content hash of (image bytes, prompt, model name)
+so that regenerating the same report does not spend another Gemini call. There are
+two tiers: a small in-process LRU shared by all sessions, and a size-bounded SQLite
+store on disk that survives restarts and is shared by every worker process.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Cache configuration (overridable from the environment)
+REPORT_CACHE_PATH = os.getenv(
+    'REPORT_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.medinsight', 'report_cache.sqlite3')
+)
+REPORT_CACHE_TTL = float(os.getenv('REPORT_CACHE_TTL', 7 * 24 * 3600))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', 5000))
+REPORT_CACHE_MEMORY_ENTRIES = int(os.getenv('REPORT_CACHE_MEMORY_ENTRIES', 256))
+
+
+def image_digest(image):
+    """Return a SHA-256 digest of the decoded pixels of a PIL image"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.digest()
+
+
+def cached_image_digest(image):
+    """Return the pixel digest of an image, computed once and kept in image.info (do not modify it afterwards)"""
+    digest = image.info.get('pixel_digest')
+    if digest is None:
+        digest = image_digest(image)
+        image.info['pixel_digest'] = digest
+    return digest
+
+
+def content_key(*parts):
+    """Return the SHA-256 hex digest of a sequence of byte strings"""
+    digest = hashlib.sha256()
+    for part in parts:
+        # Length-prefix every part so that different splits never collide
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def make_cache_key(image_bytes, prompt, model_name):
+    """Build the cache key for a (image bytes, prompt, model name) triple"""
+    return content_key(image_bytes or b'', prompt.encode('utf-8'), model_name.encode('utf-8'))
+
+
+class ReportCache:
+    """Two-tier (memory LRU + SQLite) cache of generated report text"""
+
+    def __init__(self, path=REPORT_CACHE_PATH, ttl=REPORT_CACHE_TTL,
+                 max_entries=REPORT_CACHE_MAX_ENTRIES, memory_entries=REPORT_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._session_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+        self._conn = None
+        try:
+            self._conn = self._connect()
+        except (sqlite3.Error, OSError):
+            # Fall back to a memory-only cache if the disk tier is unavailable
+            self._conn = None
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reports (
+                key TEXT PRIMARY KEY,
+                report TEXT NOT NULL,
+                model TEXT,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS reports_last_access ON reports(last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        return conn
+
+    def _bump(self, name):
+        self._session_stats[name] += 1
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                "INSERT INTO counters(name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,)
+            )
+        except sqlite3.Error:
+            pass
+
+    def _remember(self, key, created_at, report):
+        self._memory[key] = (created_at, report)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached report for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, report = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._bump('memory_hits')
+                    return report
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT report, created_at FROM reports WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        report, created_at = row
+                        if now - created_at <= self.ttl:
+                            self._conn.execute("UPDATE reports SET last_access = ? WHERE key = ?", (now, key))
+                            self._remember(key, created_at, report)
+                            self._bump('disk_hits')
+                            return report
+                        self._conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+                except sqlite3.Error:
+                    pass
+
+            self._bump('misses')
+            return None
+
+    def contains(self, key):
+        """Whether a valid report is cached under key, without counting a hit or miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                return True
+            if self._conn is None:
+                return False
+            try:
+                row = self._conn.execute("SELECT created_at FROM reports WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return False
+            return row is not None and now - row[0] <= self.ttl
+
+    def put(self, key, report, model_name=None):
+        """Store a report under key, evicting expired and least recently used entries"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, report)
+            self._bump('stores')
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO reports(key, report, model, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, report, model_name, now, now)
+                )
+                self._conn.execute("DELETE FROM reports WHERE created_at < ?", (now - self.ttl,))
+                self._conn.execute(
+                    "DELETE FROM reports WHERE key IN ("
+                    "SELECT key FROM reports ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            except sqlite3.Error:
+                pass
+
+    def clear(self):
+        """Drop every cached report (counters are kept)"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM reports")
+                except sqlite3.Error:
+                    pass
+
+    def stats(self):
+        """Return hit/miss counters for this process and across all sessions on disk"""
+        with self._lock:
+            totals = dict.fromkeys(self._session_stats, 0)
+            entries = len(self._memory)
+            if self._conn is not None:
+                try:
+                    for name, value in self._conn.execute("SELECT name, value FROM counters"):
+                        if name in totals:
+                            totals[name] = value
+                    entries = self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+                except sqlite3.Error:
+                    totals = dict(self._session_stats)
+            else:
+                totals = dict(self._session_stats)
+
+            hits = totals['memory_hits'] + totals['disk_hits']
+            lookups = hits + totals['misses']
+            return {
+                'process': dict(self._session_stats),
+                'total': totals,
+                'calls_saved': hits,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'entries': entries,
+                'persistent': self._conn is not None,
+            }
+
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    """Return the process-wide report cache, creating it on first use"""
+    global _report_cache
+    if _report_cache is None:
+        with _report_cache_lock:
+            if _report_cache is None:
+                _report_cache = ReportCache()
+    return _report_cache
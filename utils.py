@@ -1,241 +1,415 @@
+import hashlib
 import streamlit as st
-from PIL import Image
-import google.generativeai as genai
-import io
 from datetime import datetime
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from reportlab.lib.colors import HexColor
-import tempfile
-import time
-import random
-
-def process_image(uploaded_file):
-    """Process uploaded image file"""
+from reportlab.platypus import Paragraph, Spacer
+from pdf_engine import PILImageFlowable, get_pdf_styles, memoized_pdf, render_pdf
+from gemini_client import DeadlineExceededError, GenerationError, generate_content_async, run_sync, stream_sync
+from dicom_io import DICOM_MODALITY_PAGES, is_dicom, load_dicom_image
+from image_pipeline import (prepare_for_upload, compose_montage, decode_image, reduce_to_side, make_thumbnail,
+                            crop_to_content, normalize_bit_depth, rewindow, WINDOW_PRESETS, MODALITY_MAX_SIDE,
+                            DEFAULT_MAX_SIDE)
+from key_slices import select_key_slices
+from quality_gate import run_quality_checks
+from modality_classifier import (answers_locally, classify_modality, local_classification_report,
+                                 record_local, record_remote)
+from report_cache import cached_image_digest, content_key, get_report_cache, make_cache_key
+from report_archive import get_report_archive
+from pdf_text import extract_pdf_text
+from perceptual_hash import (NEAR_DUPLICATE_DISTANCE, NEAR_DUPLICATE_REUSE_DISTANCE, get_near_duplicate_index,
+                             image_hashes)
+
+# Report page titles, keyed by the modality names used throughout the app
+PAGE_TITLES = {
+    'xray': "🩻 X-ray Report",
+    'ct': "🔬 CT Scan Report",
+    'mri': "🧠 MRI Scan Report",
+    'ultrasound': "🔊 Ultrasound Report",
+}
+
+def process_image(uploaded_file, modality=None):
+    """Process uploaded image file (JPEG/PNG/TIFF, or DICOM decoded to an 8-bit image)
+
+    The image is decoded no larger than the biggest size used for analysis,
+    16-bit data is windowed to 8 bits with the modality's window, and the result
+    is cropped to its content (the crop box is kept in image.info['crop_box']);
+    pass the result through make_thumbnail for display.
+    """
     try:
-        image = Image.open(uploaded_file)
-        return image
+        if is_dicom(uploaded_file):
+            return crop_to_content(reduce_to_side(load_dicom_image(uploaded_file)))
+        return crop_to_content(normalize_bit_depth(decode_image(uploaded_file), modality))
     except Exception as e:
         st.error(f"Error processing image: {str(e)}")
         return None
 
-def generate_report_with_retry(image, prompt, max_retries=3, base_delay=2, model_name='gemini-2.0-flash-lite'):
-    """Generate report with retry mechanism and model fallback"""
-    # Convert image to bytes
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+def show_window_control(image, modality=None):
+    """Let the user re-window a high-bit-depth upload (Auto, a modality preset or a custom window)
+
+    Returns the image to analyse. The kept original array is only needed here,
+    so it is dropped afterwards instead of travelling into the session state.
+    """
+    if image is None or image.info.get('raw_pixels') is None:
+        return image
+    presets = WINDOW_PRESETS.get(modality, {})
+    choice = st.selectbox("🪟 Window", ['auto'] + list(presets) + ['custom'],
+                          format_func=lambda name: name.replace('_', ' ').title(),
+                          help="How the 16-bit values of this image are mapped to gray levels")
+    if choice == 'custom':
+        pixels = image.info['raw_pixels']
+        low = float(pixels.min())
+        high = max(float(pixels.max()), low + 1)
+        center, width = image.info['window']
+        center = st.slider("Window center", low, high, min(max(center, low), high))
+        width = st.slider("Window width", 1.0, high - low + 1, min(max(width, 1.0), high - low + 1))
+        image = rewindow(image, center, width)
+    elif choice != 'auto':
+        image = rewindow(image, preset=choice, modality=modality)
+    image.info.pop('raw_pixels', None)
+    return image
+
+def check_modality_routing(image, modality):
+    """Warn if a DICOM image's Modality tag belongs to a different report page"""
+    tagged = image.info.get('dicom_modality')
+    page = DICOM_MODALITY_PAGES.get(tagged)
+    if page and page != modality:
+        st.warning(f"⚠️ This DICOM file is tagged as modality **{tagged}**. "
+                   f"The {PAGE_TITLES[page]} page is designed for it.")
+
+def cached_image_hashes(image):
+    """Return the perceptual hashes of an image, computed once and kept in image.info"""
+    hashes = image.info.get('perceptual_hashes')
+    if hashes is None:
+        hashes = image_hashes(image)
+        image.info['perceptual_hashes'] = hashes
+    return hashes
+
+def report_cache_key(images, prompt, model_name):
+    """Exact report cache key of the images, prompt and model of a report"""
+    return make_cache_key(b''.join(cached_image_digest(i) for i in images), prompt, model_name)
+
+def warn_near_duplicate(image, prompt, model_name='gemini-2.0-flash-lite'):
+    """Warn before generating if a near-identical image has been analysed before and a new call would be made"""
+    report_cache = get_report_cache()
+    try:
+        if report_cache.contains(report_cache_key([image], prompt, model_name)):
+            # Generating again is served from the exact report cache; no call to warn about
+            return
+        matches = get_near_duplicate_index().find(cached_image_hashes(image), max_distance=NEAR_DUPLICATE_DISTANCE)
+    except Exception:
+        return
+    if not matches:
+        return
+    context = make_cache_key(b'', prompt, model_name)
+    nearest = matches[0]
+    if any(m.context == context and m.distance <= NEAR_DUPLICATE_REUSE_DISTANCE and report_cache.contains(m.cache_key)
+           for m in matches):
+        st.info(f"♻️ A near-identical image ({nearest.distance} of 64 hash bits differ) was analysed with "
+                f"this report type before. Its stored report will be reused instead of a new Gemini call.")
+    else:
+        st.warning(f"🔁 This image looks nearly identical to one analysed before ({nearest.distance} of 64 "
+                   f"hash bits differ). Generating a report will spend another Gemini call.")
+
+def check_image_quality(image, modality=None):
+    """Run the pre-flight quality checks and show their outcome; returns False if the image is rejected"""
+    report = run_quality_checks(image, modality)
+    for check in report.rejected:
+        st.error(f"🚫 {check.message}")
+    for check in ([] if report.rejected else report.flagged):
+        st.warning(f"⚠️ {check.message}")
+    with st.expander(f"🧪 Quality checks ({report.seconds * 1000:.1f} ms)"):
+        for check in report.checks:
+            status = "✅" if check.passed else ("🚫" if check in report.rejected else "⚠️")
+            st.markdown(f"{status} **{check.name.replace('_', ' ').capitalize()}**: {check.value:.3g} "
+                        f"(threshold {check.threshold:g}) · {check.seconds * 1000:.2f} ms")
+    return not report.rejected
+
+def show_key_slice_selection(uploaded_files, k, modality=None):
+    """Select the k most informative slices of an uploaded series and show them as a montage
+
+    The key slices are tiled into one labelled montage so the whole series costs a
+    single request. The result is kept in session state, so reruns with the same
+    files and k do not score the series again. Returns (KeySliceSelection, Montage),
+    or None.
+    """
+    # Keyed by upload content: a new study with generic DICOM names must not reuse the last montage
+    selection_key = tuple(getattr(f, 'file_id', None) or hashlib.sha256(f.getvalue()).hexdigest()
+                          for f in uploaded_files) + (k, modality)
+    stored = st.session_state.get('key_slice_selection')
+    if stored is None or stored[0] != selection_key:
+        try:
+            with st.spinner("🔎 Scoring slices and picking key slices..."):
+                selection = select_key_slices(uploaded_files, k)
+                montage = None
+                if selection.images:
+                    montage = compose_montage(selection.images,
+                                              labels=[f"Slice {s.index + 1}" for s in selection.slices],
+                                              sources=[s.name for s in selection.slices],
+                                              max_side=MODALITY_MAX_SIDE.get(modality, DEFAULT_MAX_SIDE))
+        except Exception as e:
+            st.error(f"Error reading series: {str(e)}")
+            return None
+        st.session_state['key_slice_selection'] = (selection_key, selection, montage)
+    else:
+        selection, montage = stored[1], stored[2]
+    
+    if montage is None:
+        st.warning("No readable slices found in the upload.")
+        return None
+    
+    st.image(montage.image, use_container_width=True,
+             caption=f"{len(montage.tiles)} key slices selected from {selection.total} slices")
+    with st.expander("🗂️ Tile to source mapping"):
+        for tile, scored in zip(montage.tiles, selection.slices):
+            st.markdown(f"**Tile {tile.number}** · {tile.label} · `{tile.source}` · score {scored.score:.2f}")
+    return selection, montage
+
+def series_prompt(prompt, selection, montage):
+    """Extend a modality prompt to describe the key-slice montage sent with it"""
+    tiles = "; ".join(f"tile {tile.number} = {tile.label.lower()}" for tile in montage.tiles)
+    return (f"{prompt}\n\nThe image is a montage of {len(montage.tiles)} numbered tiles, each a key slice "
+            f"selected from a series of {selection.total} slices, in anatomical order reading left to right "
+            f"and top to bottom ({tiles}). Base the report on all tiles and cite the tile number for every finding.")
+
+def generate_report_with_retry(image, prompt, max_retries=3, base_delay=2, model_name='gemini-2.0-flash-lite',
+                               placeholder=None, modality=None):
+    """Generate report with retry mechanism and model fallback
+
+    If a Streamlit placeholder is given, the report is streamed into it as it arrives.
+    The modality ('xray', 'ct', 'mri', 'ultrasound' or 'classification') picks the
+    upload resolution. image may also be a list of images (e.g. key slices of a
+    series), which are all sent in the same request.
+    """
+    images = list(image) if isinstance(image, (list, tuple)) else [image]
     
-    # List of models to try in order
-    # Prioritize the requested model, then fall back to efficient/stable models
-    models_to_try = [
-        model_name,
-        'gemini-2.0-flash-lite',
-        'gemini-2.5-flash-lite',
-        'gemini-flash-latest',
-        'gemini-pro-latest'
-    ]
+    # Serve repeated requests for the same image and prompt from the report cache
+    report_cache = get_report_cache()
+    cache_key = report_cache_key(images, prompt, model_name)
+    cached_report = report_cache.get(cache_key)
+    if cached_report is not None:
+        if placeholder is not None:
+            placeholder.markdown(cached_report)
+        return cached_report
     
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_models = [x for x in models_to_try if not (x in seen or seen.add(x))]
+    # A re-exported, re-compressed or slightly cropped copy of an image reported
+    # with the same prompt reuses that report
+    near_duplicates = get_near_duplicate_index()
+    context = make_cache_key(b'', prompt, model_name)
+    hashes = cached_image_hashes(images[0]) if len(images) == 1 else None
+    if hashes is not None and NEAR_DUPLICATE_REUSE_DISTANCE >= 0:
+        for match in near_duplicates.find(hashes, context, NEAR_DUPLICATE_REUSE_DISTANCE):
+            reused_report = report_cache.get(match.cache_key)
+            if reused_report is not None:
+                near_duplicates.record_reuse()
+                if placeholder is not None:
+                    placeholder.markdown(reused_report)
+                return reused_report
     
-    last_error = None
+    # Downscale and encode once; every retry reuses the same bytes
+    contents = [prompt]
+    for current_image in images:
+        encoded = prepare_for_upload(current_image, modality)
+        contents.append({'mime_type': encoded.mime_type, 'data': encoded.data})
+    try:
+        # Retries and model fallback run on the shared asyncio client; identical
+        # concurrent requests (same cache key) share one in-flight call
+        if placeholder is None:
+            text, answered_by = run_sync(generate_content_async(
+                contents, model_name, max_retries, base_delay, flight_key=cache_key
+            ))
+        else:
+            text, answered_by = render_stream(
+                stream_sync(contents, model_name, max_retries, base_delay, flight_key=cache_key), placeholder
+            )
+    except GenerationError as e:
+        if placeholder is not None:
+            placeholder.empty()
+        if isinstance(e, DeadlineExceededError):
+            st.error(f"Report generation timed out. {str(e)}")
+        else:
+            st.error(f"Failed to generate report after trying multiple models. Last error: {str(e.last_error or e)}")
+        return None
     
-    for current_model_name in unique_models:
+    report_cache.put(cache_key, text, answered_by)
+    if hashes is not None:
+        near_duplicates.add(hashes, cache_key, context)
+    return text
+
+def generate_classification_report(image, prompt, model_name='gemini-2.0-flash-lite', placeholder=None):
+    """Classify the modality locally, asking Gemini only when the local confidence is too low"""
+    try:
+        prediction = classify_modality(image)
+    except Exception:
+        prediction = None
+    if prediction is not None and answers_locally(prediction):
+        record_local()
+        report = local_classification_report(prediction)
+        if placeholder is not None:
+            placeholder.markdown(report)
+        return report
+    
+    report = generate_report_with_retry(image, prompt, model_name=model_name,
+                                        placeholder=placeholder, modality='classification')
+    if report and prediction is not None:
+        record_remote(prediction, report)
+    return report
+
+def render_stream(stream, placeholder):
+    """Render each streamed update into a placeholder and return the stream's (text, answered_by)
+
+    The final text is always rendered: joining a non-streaming in-flight request
+    for the same report yields no updates, only the result.
+    """
+    shown = None
+    while True:
         try:
-            # Create model
-            model = genai.GenerativeModel(current_model_name)
-            # st.info(f"Attempting with model: {current_model_name}")
-        except Exception as e:
-            # st.warning(f"Skipping model {current_model_name}: {str(e)}")
-            continue
-            
-        # Retry loop for the current model
-        for attempt in range(max_retries + 1):
-            try:
-                # Generate content with the image and prompt
-                response = model.generate_content([
-                    prompt,
-                    {'mime_type': 'image/png', 'data': img_byte_arr}
-                ])
-                
-                # Return the response text if successful
-                if response.text:
-                    return response.text
-                
-            except Exception as e:
-                last_error = e
-                error_message = str(e).lower()
-                
-                # Handle Rate Limits (429 or Quota Exceeded)
-                if "quota exceeded" in error_message or "429" in error_message or "resource exhausted" in error_message:
-                    if attempt < max_retries:
-                        delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                        # st.warning(f"Rate limit on {current_model_name}. Retrying in {delay:.1f}s...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        # st.warning(f"Rate limit persisted for {current_model_name}. Switching model...")
-                        break # Break retry loop to try next model
-                
-                # Handle Internal Errors (500s)
-                elif "internal" in error_message or "overloaded" in error_message:
-                    if attempt < max_retries:
-                        time.sleep(base_delay)
-                        continue
-                    else:
-                        break # Try next model
-                
-                # Handle Blocked Content or other API errors
-                else:
-                    st.error(f"Error with {current_model_name}: {str(e)}")
-                    break # Try next model immediately for non-transient errors
-        
-    st.error(f"Failed to generate report after trying multiple models. Last error: {str(last_error)}")
-    return None
+            shown = next(stream)
+            placeholder.markdown(shown)
+        except StopIteration as done:
+            text = done.value[0]
+            if text != shown:
+                placeholder.markdown(text)
+            return done.value
 
 def generate_text_report_with_retry(prompt, max_retries=3, base_delay=2, model_name='gemini-2.0-flash-lite'):
     """Generate text-based report with retry mechanism and model fallback"""
+    report_cache = get_report_cache()
+    cache_key = make_cache_key(b'', prompt, model_name)
+    cached_report = report_cache.get(cache_key)
+    if cached_report is not None:
+        return cached_report
     
-    # List of models to try in order
-    models_to_try = [
-        model_name,
-        'gemini-2.0-flash-lite',
-        'gemini-2.5-flash-lite',
-        'gemini-flash-latest',
-        'gemini-pro-latest'
-    ]
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_models = [x for x in models_to_try if not (x in seen or seen.add(x))]
-    
-    last_error = None
-    
-    for current_model_name in unique_models:
-        try:
-            model = genai.GenerativeModel(current_model_name)
-            # st.info(f"Attempting with model: {current_model_name}")
-        except Exception as e:
-            continue
-            
-        for attempt in range(max_retries + 1):
-            try:
-                response = model.generate_content(prompt)
-                if response.text:
-                    return response.text
-                
-            except Exception as e:
-                last_error = e
-                error_message = str(e).lower()
-                
-                if "quota exceeded" in error_message or "429" in error_message or "resource exhausted" in error_message:
-                    if attempt < max_retries:
-                        delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                        # st.warning(f"Rate limit on {current_model_name}. Retrying in {delay:.1f}s...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        # st.warning(f"Rate limit persisted for {current_model_name}. Switching model...")
-                        break
-                elif "internal" in error_message or "overloaded" in error_message:
-                    if attempt < max_retries:
-                        time.sleep(base_delay)
-                        continue
-                    else:
-                        break
-                else:
-                    # st.error(f"Error with {current_model_name}: {str(e)}")
-                    break
+    try:
+        text, answered_by = run_sync(generate_content_async(
+            prompt, model_name, max_retries, base_delay, flight_key=cache_key
+        ))
+    except GenerationError as e:
+        if isinstance(e, DeadlineExceededError):
+            st.error(f"Report generation timed out. {str(e)}")
+        else:
+            st.error(f"Failed to generate report. Please try again later. Last error: {str(e.last_error or e)}")
+        return None
     
-    st.error(f"Failed to generate report. Please try again later. Last error: {str(last_error)}")
-    return None
+    report_cache.put(cache_key, text, answered_by)
+    return text
 
 def generate_report(image, prompt):
     """Generate report using Gemini API with retry mechanism (backward compatibility)"""
     return generate_report_with_retry(image, prompt)
 
 def create_pdf_report(analysis_text, image=None, report_type="Medical Report", patient_info=None):
-    """Create a PDF report with analysis results"""
+    """Create a PDF report with analysis results, rendered entirely in memory"""
     try:
-        # Create a temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        
-        # Create document
-        doc = SimpleDocTemplate(temp_file.name, pagesize=A4)
         story = []
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=HexColor('#1e3a8a'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=16,
-            textColor=HexColor('#667eea'),
-            spaceAfter=12,
-            spaceBefore=12
-        )
+        styles = get_pdf_styles()
         
         # Title
-        story.append(Paragraph(report_type, title_style))
-        story.append(Paragraph("AI-Powered Medical Analysis Report", styles['Normal']))
+        story.append(Paragraph(report_type, styles['title']))
+        story.append(Paragraph("AI-Powered Medical Analysis Report", styles['normal']))
         story.append(Spacer(1, 0.3*inch))
         
         # Patient Information
         if patient_info:
-            story.append(Paragraph("Patient Information", heading_style))
+            story.append(Paragraph("Patient Information", styles['heading']))
             for key, value in patient_info.items():
-                story.append(Paragraph(f"<b>{key}:</b> {value}", styles['Normal']))
+                story.append(Paragraph(f"<b>{key}:</b> {value}", styles['normal']))
             story.append(Spacer(1, 0.2*inch))
         
         # Timestamp
-        story.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
+        story.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['normal']))
         story.append(Spacer(1, 0.3*inch))
         
-        # Image (if provided)
+        # Image (if provided), passed to ReportLab straight from memory
         if image:
-            # Save image to temporary file
-            img_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-            image.save(img_temp.name, 'PNG')
-            
-            # Add image to PDF
-            story.append(Paragraph("Medical Image", heading_style))
-            img = RLImage(img_temp.name, width=4*inch, height=3*inch)
-            story.append(img)
+            story.append(Paragraph("Medical Image", styles['heading']))
+            story.append(PILImageFlowable(image, width=4*inch, height=3*inch))
+            crop_box = image.info.get('crop_box')
+            if crop_box:
+                original_size = image.info.get('original_size', image.size)
+                story.append(Paragraph(
+                    f"Cropped to the region of interest ({crop_box[0]}, {crop_box[1]}) - ({crop_box[2]}, {crop_box[3]}) "
+                    f"of the {original_size[0]} x {original_size[1]} px original; uniform borders were removed.",
+                    styles['normal']
+                ))
+            window = image.info.get('window')
+            if window:
+                story.append(Paragraph(
+                    f"Displayed from high-bit-depth data with window center {window[0]:g}, width {window[1]:g}.",
+                    styles['normal']
+                ))
             story.append(Spacer(1, 0.3*inch))
         
         # Analysis
-        story.append(Paragraph("AI Analysis Results", heading_style))
+        story.append(Paragraph("AI Analysis Results", styles['heading']))
         
         # Split text into paragraphs
         paragraphs = analysis_text.split('\n\n')
         for para in paragraphs:
             if para.strip():
-                story.append(Paragraph(para.replace('\n', '<br/>'), styles['Normal']))
+                story.append(Paragraph(para.replace('\n', '<br/>'), styles['normal']))
                 story.append(Spacer(1, 0.1*inch))
         
-        # Build PDF
-        doc.build(story)
-        
-        # Read the PDF content
-        with open(temp_file.name, 'rb') as f:
-            pdf_data = f.read()
-        
-        return pdf_data
+        return render_pdf(story)
         
     except Exception as e:
         st.error(f"Error creating PDF report: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+def pdf_report_key(analysis_text, image=None, report_type="Medical Report", patient_info=None):
+    """Hash everything a PDF report is rendered from: text, image pixels, report type and patient info"""
+    return content_key(analysis_text.encode('utf-8'),
+                       cached_image_digest(image) if image else b'',
+                       report_type.encode('utf-8'),
+                       repr(list((patient_info or {}).items())).encode('utf-8'))
+
+def archive_report(analysis_text, image=None, report_type="Medical Report"):
+    """Keep a generated report in the report archive for bulk export; returns its id, or None"""
+    try:
+        return get_report_archive().add(analysis_text, image, report_type)
+    except Exception as e:
+        st.warning(f"Report could not be archived for bulk export: {str(e)}")
+        return None
+
+def lazy_pdf_report(analysis_text, image=None, report_type="Medical Report", patient_info=None, report_id=None):
+    """Return a callable for st.download_button that renders the PDF only when the download is clicked
+
+    Nothing is hashed or rendered on reruns. On click the PDF is memoized on
+    pdf_report_key, so downloading an unchanged report again is served from
+    memory, and the patient details are recorded on the archived report
+    (report_id) so bulk exports match the download. The callable runs outside
+    the page script, where st.error is ignored, so a failed render raises instead.
+    """
+    patient_info = dict(patient_info) if patient_info else None
+
+    def build():
+        pdf = create_pdf_report(analysis_text, image, report_type, patient_info)
+        if pdf is None:
+            raise RuntimeError("PDF report could not be created")
+        return pdf
+
+    def render():
+        pdf = memoized_pdf(pdf_report_key(analysis_text, image, report_type, patient_info), build)
+        if report_id is not None:
+            get_report_archive().set_patient_info(report_id, patient_info)
+        return pdf
+
+    return render
+
+def extract_text_from_pdf(pdf_file):
+    """Extract text from an uploaded PDF report (capped, page-parallel, cached by content hash)"""
+    try:
+        result = extract_pdf_text(pdf_file)
+    except Exception as e:
+        st.error(f"Error reading PDF: {str(e)}")
+        return None
+    if result.truncated:
+        st.warning(f"⚠️ Only the first {result.pages} of {result.total_pages} pages were read (page limit); "
+                   f"the analysis is based on those pages.")
+    if result.unread_pages:
+        st.warning(f"⚠️ {result.unread_pages} of {result.pages} pages could not be read in time and were left out; "
+                   f"try again to read the full document.")
+    if result.page_seconds and not result.cached:
+        slowest = max(range(result.pages), key=result.page_seconds.__getitem__)
+        st.caption(f"Read {result.pages} page(s) in {result.seconds * 1000:.0f} ms "
+                   f"(slowest: page {slowest + 1}, {result.page_seconds[slowest] * 1000:.0f} ms)")
+    return result.text
\ No newline at end of file